@@ -0,0 +1,67 @@
+"""
+Benchmark: estadísticas de /historial sobre el historial en columnas.
+
+Mide el tiempo de `get_history_stats` para un usuario con un año de sesiones y
+compara la memoria de SessionColumns contra la lista de dicts {"date", "subject"}.
+
+Uso:
+    python -m benchmarks.bench_history [dias]
+"""
+import os
+import sys
+import json
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from src.models import UserRecord
+from src.services import data_service
+
+SUBJECTS = ["Cálculo", "Álgebra", "Física", "Química", "Programación"]
+
+
+def make_sessions(days: int):
+    today = date.today()
+    sessions = []
+    for i in range(days):
+        day = (today - timedelta(days=i)).isoformat()
+        for j in range(1 + i % 3):
+            sessions.append({"date": day, "subject": SUBJECTS[(i + j) % len(SUBJECTS)]})
+    return sessions
+
+
+def measure(build):
+    tracemalloc.start()
+    obj = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, size
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    raw = json.dumps(make_sessions(days))
+
+    sessions, dict_bytes = measure(lambda: json.loads(raw))
+    data_service.SessionColumns.from_record(UserRecord.from_json({"sessions": sessions}))  # calentar la tabla de materias
+    columns, col_bytes = measure(lambda: data_service.SessionColumns.from_record(UserRecord.from_json({"sessions": sessions})))
+    print(f"{len(sessions):,} sesiones")
+    print(f"lista de dicts:   {dict_bytes / 1024:8.1f} KiB")
+    print(f"SessionColumns:   {col_bytes / 1024:8.1f} KiB  ({dict_bytes / col_bytes:.1f}x menos)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_service.DATA_FILE = os.path.join(tmp, "user_data.json")
+        data_service._save_data({"1": UserRecord.from_json({"sessions": sessions})})
+        data_service.get_history_stats(1)  # construye y cachea las columnas
+
+        n = 1000
+        start = time.perf_counter()
+        for _ in range(n):
+            data_service.get_history_stats(1)
+        per_call = (time.perf_counter() - start) / n
+        print(f"get_history_stats: {per_call * 1e6:8.1f} µs por usuario")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark: costo de revisar formatos antiguos en cada carga de user_data.json.
+
+Antes, cada vez que `_load_data` leía el archivo (primer uso o cambio de mtime)
+recorría todos los usuarios buscando `study_goal` / `study_sessions`. Ahora eso
+lo hace `run_migrations()` una sola vez al arrancar. Se mide una carga con y sin
+ese recorrido, y el arranque con la migración de un archivo antiguo.
+
+Uso:
+    python -m benchmarks.bench_migrations [usuarios]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from src.services import data_service, migrations, subscription_service
+
+SUBJECTS = ["Cálculo", "Álgebra", "Física", "Química"]
+
+
+def make_users(n: int, legacy: bool = False):
+    today = date.today()
+    users = {}
+    for uid in range(n):
+        days = [(today - timedelta(days=i)).isoformat() for i in range(uid % 20)]
+        if legacy:
+            users[str(uid)] = {"study_goal": 3, "study_sessions": days}
+        else:
+            users[str(uid)] = {
+                "goals": {"General": 3},
+                "sessions": [{"date": d, "subject": SUBJECTS[i % len(SUBJECTS)]} for i, d in enumerate(days)],
+            }
+    return users
+
+
+def legacy_walk(raw):
+    """El recorrido que hacía cada carga antes (mismo trabajo que los pasos de migración)."""
+    for _, step in migrations.MIGRATIONS["user_data"]:
+        raw = step(raw)
+    return raw
+
+
+def time_load(with_walk: bool, repeat: int) -> float:
+    """Mejor tiempo de una carga completa del archivo (json + modelo), con o sin el recorrido."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with open(data_service.DATA_FILE) as f:
+            raw = json.load(f)
+        if with_walk:
+            raw = legacy_walk(raw)
+        {cid: data_service.UserRecord.from_json(u) for cid, u in raw.items()}
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        data_service.DATA_FILE = os.path.join(tmp, "user_data.json")
+        subscription_service.CHAT_IDS_FILE = os.path.join(tmp, "chat_ids.json")
+        migrations.SCHEMA_VERSION_FILE = os.path.join(tmp, "schema_version.json")
+
+        with open(data_service.DATA_FILE, "w") as f:
+            json.dump(make_users(n, legacy=True), f)
+        start = time.perf_counter()
+        migrations.run_migrations()
+        print(f"{n:,} usuarios: migración al arrancar {(time.perf_counter() - start) * 1000:.1f} ms (una vez)")
+
+        with open(data_service.DATA_FILE, "w") as f:
+            json.dump(make_users(n), f)
+        before = time_load(True, 10)
+        after = time_load(False, 10)
+        print(f"carga con revisión de formato: {before * 1000:8.2f} ms")
+        print(f"carga sin revisión:            {after * 1000:8.2f} ms")
+
+        walk_raw = make_users(n)
+        start = time.perf_counter()
+        for _ in range(20):
+            legacy_walk(walk_raw)
+        walk = (time.perf_counter() - start) / 20
+        print(f"recorrido ahorrado por carga:  {walk * 1000:8.2f} ms ({walk / before:.1%} de la carga)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark: memoria del modelo interno (src.models) vs dicts crudos de JSON.
+
+Genera N usuarios con metas y sesiones, y compara lo que ocupa el JSON parseado
+({"goals": {...}, "sessions": [{"date", "subject"}, ...]}) contra UserRecord.
+
+Uso:
+    python -m benchmarks.bench_model_memory [usuarios] [sesiones_por_usuario]
+"""
+import gc
+import json
+import sys
+import tracemalloc
+from datetime import date, timedelta
+
+from src.models import UserRecord
+
+SUBJECTS = ["Cálculo I", "Álgebra Lineal", "Física General", "Química", "Programación", "Inglés"]
+
+
+def make_raw(users: int, sessions_per_user: int) -> str:
+    today = date.today()
+    data = {}
+    for uid in range(users):
+        data[str(100000000 + uid)] = {
+            "goals": {SUBJECTS[(uid + k) % len(SUBJECTS)]: 3 for k in range(3)},
+            "sessions": [
+                {"date": (today - timedelta(days=i)).isoformat(), "subject": SUBJECTS[(uid + i) % len(SUBJECTS)]}
+                for i in range(sessions_per_user)
+            ],
+        }
+    return json.dumps(data)
+
+
+def measure(label: str, build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<22} {size / 2**20:9.1f} MiB")
+    del obj
+    return size
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    sessions_per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    raw = make_raw(users, sessions_per_user)
+    print(f"{users:,} usuarios x {sessions_per_user} sesiones")
+
+    as_dicts = measure("dicts (json.loads)", lambda: json.loads(raw))
+    parsed = json.loads(raw)
+    as_model = measure("UserRecord", lambda: {k: UserRecord.from_json(v) for k, v in parsed.items()})
+    print(f"Reducción: {as_dicts / as_model:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
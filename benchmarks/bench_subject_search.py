@@ -0,0 +1,70 @@
+"""
+Benchmark: búsqueda aproximada de materias con SubjectIndex.
+
+Arma un índice con miles de materias y mide `search` (/proximos) y `suggest`
+(sugerencias al registrar sesiones) contra recorrer la lista completa comparando
+cada nombre normalizado, que es lo que haría un filtro sin índice.
+
+Uso:
+    python -m benchmarks.bench_subject_search [num_materias]
+"""
+import random
+import sys
+import time
+
+from src.utils.subjects import SubjectIndex, normalize_subject
+
+WORDS = ["Cálculo", "Álgebra", "Lineal", "Física", "Química", "Orgánica", "Inorgánica", "Programación",
+         "Economía", "Estadística", "Biología", "Celular", "Molecular", "Historia", "Arte", "Termodinámica",
+         "Ecuaciones", "Diferenciales", "Mecánica", "Cuántica", "Fluidos", "Electromagnetismo", "Geometría",
+         "Análisis", "Numérico", "Funcional", "Complejo", "Probabilidades", "Derecho", "Civil", "Penal",
+         "Romano", "Filosofía", "Ética", "Lógica", "Psicología", "Social", "Sociología", "Antropología",
+         "Contabilidad", "Finanzas", "Marketing", "Gestión", "Proyectos", "Redes", "Sistemas", "Operativos",
+         "Bases", "Datos", "Algoritmos", "Compiladores", "Inteligencia", "Artificial", "Anatomía",
+         "Fisiología", "Bioquímica", "Genética", "Ecología", "Botánica", "Zoología", "Microbiología",
+         "Farmacología", "Patología", "Literatura", "Lingüística", "Fonética", "Inglés", "Francés",
+         "Alemán", "Música", "Dibujo", "Diseño", "Arquitectura", "Urbanismo", "Estructuras", "Materiales",
+         "Hidráulica", "Topografía", "Electrónica", "Circuitos", "Señales", "Control", "Robótica"]
+LEVELS = ["", " I", " II", " III", " Avanzada", " Aplicada"]
+QUERIES = ["calculo", "CALCULO I", "algebra lineal", "fisica cuantica", "quimica organica", "progamacion", "termodinamica"]
+
+
+def make_subjects(n: int):
+    rng = random.Random(42)
+    names = set()
+    while len(names) < n:
+        words = rng.sample(WORDS, rng.randint(1, 3))
+        names.add(" ".join(words) + rng.choice(LEVELS))
+    return sorted(names)
+
+
+def per_call(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for q in QUERIES:
+            fn(q)
+    return (time.perf_counter() - start) / (repeat * len(QUERIES))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    names = make_subjects(n)
+
+    start = time.perf_counter()
+    index = SubjectIndex(names)
+    print(f"{len(index):,} materias, índice armado en {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    normalized = [normalize_subject(name) for name in names]
+    scan = per_call(lambda q: [name for name, key in zip(names, normalized) if normalize_subject(q) in key], 20)
+    search = per_call(index.search, 20)
+    suggest = per_call(index.suggest, 20)
+    exact = per_call(lambda q: index.get(names[0]), 2000)
+
+    print(f"recorrido lineal (substring):  {scan * 1e6:8.1f} µs por consulta")
+    print(f"SubjectIndex.search:           {search * 1e6:8.1f} µs por consulta")
+    print(f"SubjectIndex.suggest:          {suggest * 1e6:8.1f} µs por consulta")
+    print(f"SubjectIndex.get (exacta):     {exact * 1e6:8.1f} µs por consulta")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,167 +1,171 @@
 import os
+import json
 import asyncio
 import logging
-from datetime import datetime, date, timedelta
+from datetime import datetime, date
 from dotenv import load_dotenv
 
+# Cargar variables de entorno del archivo .env (antes de importar módulos que leen configuración)
+load_dotenv()
+
 # APScheduler: Librería para ejecutar tareas programadas (check diario)
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
 # Importaciones de módulos del proyecto
-from src.services.telegram_bot import create_bot_application, get_subscriptions
-from src.services.notion_service import NotionClient
-from src.services.data_service import get_weekly_progress, get_current_streak
+from src.services.telegram_bot import create_bot_application
+from src.services.subscription_service import get_subscriptions, get_subscription_index
+from src.services.exam_cache import exam_cache, EXAM_CACHE_TTL
+from src.services.report_service import build_reports_batch, due_reports, mark_delivered
+from src.services import leaderboard_service
+from src.services.migrations import run_migrations
 from src.utils.quotes import get_random_quote
+from src.utils.logging_setup import setup_logging
+from src.utils.loop_watchdog import watchdog, register_handler
+from src.utils import metrics
+
+# Logs por cola: el loop de eventos solo encola, un hilo aparte escribe a consola
+setup_logging()
 
-# Configuración básica para ver logs en la consola
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Reporte Semanal: hora (domingo) desde la que se arman los reportes y tamaño de cada lote
+REPORT_BUILD_START_HOUR = int(os.getenv("WEEKLY_REPORT_BUILD_HOUR", "14"))
+REPORT_BUILD_BATCH = int(os.getenv("WEEKLY_REPORT_BUILD_BATCH", "200"))
+
+def render_alert(view, indices, days: int) -> str:
+    """Mensaje de alerta para un grupo de usuarios con las mismas preferencias."""
+    message = f"🚨 **ALERTA: Exámenes en los próximos {days} días** 🚨\n\n"
+    for i in indices:
+        exam = view.exams[i]
+        title = exam.titulo
+        subj = exam.materia
+        content = exam.contenido
+        
+        days_left = view.days_left[i]
+        day_msg = "HOY" if days_left == 0 else f"en {days_left} días"
+        
+        message += f"⏳ **{subj}** ({day_msg})\n"
+        message += f"📝 {title}\n"
+        if content:
+            message += f"ℹ️ _{content}_\n"
+        if exam.url:
+             message += f"🔗 [Ver en Notion]({exam.url})\n"
+        message += "-------------------------\n"
+        
+    message += f"\n{get_random_quote()}"
+    return message
 
 async def scheduled_check(application):
     """
     Función que se ejecuta cada minuto para verificar si hay usuarios que deben ser notificados.
     Compara la hora configurada por el usuario con la hora actual.
+    Los usuarios con las mismas preferencias de alerta (materias + días) reciben
+    el mismo mensaje, que se arma una sola vez.
     """
     now = datetime.now()
     current_time_str = now.strftime("%H:%M")
-    logging.info(f"Ejecutando chequeo programado a las {current_time_str}")
+    logging.debug(f"Ejecutando chequeo programado a las {current_time_str}")
     
-    # 1. Obtener lista de usuarios suscritos y sus horas preferidas
-    subscriptions = get_subscriptions()
-    if not subscriptions:
-        return
-
-    # 2. Filtrar usuarios que deben ser notificados AHORA MISMO
-    users_to_notify = []
-    for chat_id, prefs in subscriptions.items():
-        user_time = prefs.get("time", "08:00")
-        if user_time == current_time_str:
-            users_to_notify.append(chat_id)
-            logging.info(f"¡Hora de notificar al usuario {chat_id}!")
-            
+    # 1. Usuarios que deben ser notificados AHORA MISMO (índice por hora)
+    index = get_subscription_index()
+    users_to_notify = index.due_at(current_time_str)
     if not users_to_notify:
         return # Nadie programado para esta hora
 
-    logging.info(f"Notificando a {len(users_to_notify)} usuarios...")
+    logging.info("Notificando usuarios del horario", extra={"count": len(users_to_notify)})
 
     try:
-        # 3. Obtener exámenes desde Notion (Optimizamos haciendo una sola consulta para todos)
-        client = NotionClient()
-        all_upcoming = client.get_upcoming_exams()
-        
-        # Filtrar solo eventos para los próximos 5 días
-        today = date.today()
-        limit_date = today + timedelta(days=5)
-        
-        imminent_exams = []
-        for exam in all_upcoming:
-            exam_date_str = exam.get('fecha')
-            if not exam_date_str:
-                continue
-            
-            try:
-                exam_date = date.fromisoformat(exam_date_str)
-            except ValueError:
-                continue
-            
-            if today <= exam_date <= limit_date:
-                imminent_exams.append(exam)
-        
-        if not imminent_exams:
+        # 2. Vista de exámenes próximos ya calculada (se rehace al cambiar el día o los datos)
+        if exam_cache.is_stale:
+            await asyncio.to_thread(exam_cache.get_exams)
+        view = exam_cache.imminent(now.date())
+        if not view:
             return # No hay nada urgente que avisar
 
-        # 4. Construir el mensaje de alerta
-        message = "🚨 **ALERTA: Exámenes en los próximos 5 días** 🚨\n\n"
-        for exam in imminent_exams:
-            title = exam.get('titulo', 'Sin título')
-            d_str = exam.get('fecha', '-')
-            subj = exam.get('materia', 'General')
-            content = exam.get('contenido', '')
-            
-            d_date = date.fromisoformat(d_str)
-            days_left = (d_date - today).days
-            day_msg = "HOY" if days_left == 0 else f"en {days_left} días"
-            
-            message += f"⏳ **{subj}** ({day_msg})\n"
-            message += f"📝 {title}\n"
-            if content:
-                message += f"ℹ️ _{content}_\n"
-            if exam.get('url'):
-                 message += f"🔗 [Ver en Notion]({exam.get('url')})\n"
-            message += "-------------------------\n"
-            
-        message += f"\n{get_random_quote()}"
+        # 3. Solo usuarios suscritos a alguna materia con exámenes cerca (índice invertido)
+        interested = index.interested_in(view.all_subjects)
+        recipients = [chat_id for chat_id in users_to_notify if chat_id in interested]
+
+        # 4. Un mensaje por combinación distinta de preferencias
+        for (subjects, days), chat_ids in index.group_by_signature(recipients).items():
+            indices = [
+                i for i in range(view.count_within(days))
+                if subjects is None or not subjects.isdisjoint(view.subjects[i])
+            ]
+            if not indices:
+                continue
+            message = render_alert(view, indices, days)
             
-        # 5. Enviar mensaje a cada usuario programado
-        for chat_id in users_to_notify:
-            try:
-                await application.bot.send_message(chat_id=chat_id, text=message, parse_mode='Markdown')
-            except Exception as e:
-                logging.error(f"Error enviando mensaje a {chat_id}: {e}")
+            # 5. Enviar el mismo mensaje a todo el grupo
+            for chat_id in chat_ids:
+                try:
+                    await application.bot.send_message(chat_id=chat_id, text=message, parse_mode='Markdown')
+                except Exception as e:
+                    logging.error(f"Error enviando alerta: {e}", extra={"chat_id": chat_id, "sample": "alert_send_error"})
 
     except Exception as e:
         logging.error(f"Error durante el chequeo programado: {e}")
 
-async def weekly_report_job(application):
+async def exam_refresh_job():
+    """Refresca la caché de exámenes desde Notion en un hilo (no bloquea el bot)."""
+    if exam_cache.in_backoff:
+        return  # Notion falló hace poco: se reintenta cuando termine la espera
+    try:
+        await asyncio.to_thread(exam_cache.refresh)
+    except Exception as e:
+        logging.error(f"Error refrescando exámenes: {e}")
+
+async def day_rollover_job():
+    """A medianoche: recalcula la vista de exámenes próximos y los rankings para el nuevo día."""
+    today = date.today()
+    exam_cache.imminent(today)
+    leaderboard_service.rollover(today)
+
+async def weekly_report_build_job():
     """
-    Reporte Semanal Automático (Domingo 20:00).
-    Envía un resumen del progreso a todos los usuarios suscritos.
+    Reporte Semanal, fase 1 (domingo en la tarde, cada 5 minutos):
+    arma por lotes los reportes y los deja guardados listos para enviar.
+    """
+    subscriptions = get_subscriptions()
+    if not subscriptions:
+        return
+    built = build_reports_batch(subscriptions, REPORT_BUILD_BATCH)
+    if built:
+        logging.info("Reporte semanal: reportes armados", extra={"count": built})
+
+async def weekly_report_delivery_job(application):
+    """
+    Reporte Semanal, fase 2 (domingo, cada minuto):
+    envía los reportes cuyo horario ya llegó y avanza el cursor guardado en disco.
     """
-    logging.info("⏳ Ejecutando Reporte Semanal...")
     subscriptions = get_subscriptions()
-    
     if not subscriptions:
-        logging.info("No hay usuarios para el reporte semanal.")
         return
 
-    for chat_id in subscriptions.keys():
+    now = datetime.now()
+    due = due_reports(subscriptions, now)
+    if not due:
+        return
+
+    failed = []
+    for chat_id, body in due:
         try:
-            # Convertir chat_id a int para las funciones de data_service
-            cid = int(chat_id)
-            progress = get_weekly_progress(cid)
-            streak = get_current_streak(cid)
-            
-            # Enviaremos resumen siempre para mantener engagement.
-            msg = "📉 **Resumen de tu Semana** (Automático)\n\n"
-            
-            if streak > 0:
-                msg += f"🔥 **Racha Activa**: {streak} días\n"
-            else:
-                msg += f"❄️ **Racha**: 0 días (¡Empieza mañana!)\n"
-                
-            total = 0
-            details = ""
-            for subj, data in progress.items():
-                c = data['current']
-                if c > 0:
-                    details += f"- {subj}: {c} sesiones\n"
-                    total += c
-            
-            msg += f"📚 **Total Sesiones**: {total}\n\n"
-            
-            if total > 0:
-                msg += "Detalle:\n" + details
-                msg += "\n🎉 ¡Buen esfuerzo! Descansa y prepárate para la próxima. 💪"
-            else:
-                msg += "❌ No registraste actividad esta semana.\n¡La próxima será mejor! 👊"
-            
-            await application.bot.send_message(chat_id=cid, text=msg, parse_mode='Markdown')
-            logging.info(f"Reporte semanal enviado a {cid}")
-            
+            await application.bot.send_message(chat_id=int(chat_id), text=body, parse_mode='Markdown')
         except Exception as e:
-            logging.error(f"Error enviando reporte semanal a {chat_id}: {e}")
+            failed.append(chat_id)
+            logging.error(f"Error enviando reporte semanal: {e}", extra={"chat_id": chat_id, "sample": "report_send_error"})
+    # Los fallidos vuelven a la cola (con límite de intentos)
+    mark_delivered([chat_id for chat_id, _ in due], failed, now)
+    logging.info("Reporte semanal enviado", extra={"count": len(due) - len(failed)})
 
 def main():
-    # Cargar variables de entorno del archivo .env
-    load_dotenv()
     if not os.getenv("TELEGRAM_TOKEN") or not os.getenv("NOTION_TOKEN") or not os.getenv("NOTION_DB_ID"):
         logging.error("Faltan variables de entorno. Por favor revisa el archivo .env.")
         return
 
     print("Bot Académico iniciando...")
+
+    # Formatos antiguos de los archivos de datos: se migran una sola vez, aquí
+    run_migrations()
     
     # Crear la aplicación del Bot
     application = create_bot_application()
@@ -176,16 +180,38 @@ def main():
         args=[application]
     )
     
-    # NUEVO: Reporte Semanal (Domingos a las 20:00)
+    # Caché de exámenes: refresco periódico y recálculo de la vista al cambiar el día
     scheduler.add_job(
-        weekly_report_job,
-        CronTrigger(day_of_week='sun', hour=20, minute=0),
+        exam_refresh_job,
+        'interval',
+        seconds=EXAM_CACHE_TTL,
+        next_run_time=datetime.now()
+    )
+    scheduler.add_job(
+        day_rollover_job,
+        CronTrigger(hour=0, minute=0, second=5)
+    )
+    
+    # Reporte Semanal (Domingos): se arma en la tarde y se entrega escalonado
+    # desde WEEKLY_REPORT_START durante WEEKLY_REPORT_WINDOW_MIN minutos
+    scheduler.add_job(
+        weekly_report_build_job,
+        CronTrigger(day_of_week='sun', hour=f'{REPORT_BUILD_START_HOUR}-23', minute='*/5')
+    )
+    scheduler.add_job(
+        weekly_report_delivery_job,
+        CronTrigger(day_of_week='sun', minute='*'),
         args=[application]
     )
     
-    # Hook para iniciar el scheduler cuando arranque el bot
+    # Nombres de los jobs para el watchdog del loop
+    for job in (scheduled_check, exam_refresh_job, day_rollover_job, weekly_report_build_job, weekly_report_delivery_job):
+        register_handler(f"job:{job.__name__}", job)
+    
+    # Hook para iniciar el scheduler (y el watchdog del loop) cuando arranque el bot
     async def on_startup(app):
         scheduler.start()
+        watchdog.start(asyncio.get_running_loop())
         logging.info("Scheduler iniciado correctamente.")
 
     application.post_init = on_startup
@@ -198,10 +224,23 @@ def main():
 
     class HealthCheckHandler(BaseHTTPRequestHandler):
         def do_GET(self):
+            # /health: estado del loop de eventos (503 si está crónicamente bloqueado)
+            if self.path.rstrip("/") == "/health":
+                status = watchdog.snapshot()
+                status["metrics"] = metrics.snapshot()
+                self.send_response(200 if status["healthy"] else 503)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(json.dumps(status).encode())
+                return
             self.send_response(200)
             self.end_headers()
             self.wfile.write(b"Bot is alive!")
 
+        def log_message(self, format, *args):
+            # Los chequeos de salud son muy frecuentes: no ensuciar la consola
+            pass
+
     def start_health_server():
         port = int(os.environ.get("PORT", 8080))
         server = HTTPServer(("0.0.0.0", port), HealthCheckHandler)
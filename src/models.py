@@ -0,0 +1,101 @@
+"""
+Modelo interno del bot: exámenes, sesiones y datos de usuario.
+
+Los datos viajan por el código como objetos compactos (`__slots__` / tuplas con
+nombre) con fechas ya convertidas a `date` y nombres de materia internados.
+La conversión desde/hacia JSON ocurre solo en los bordes: al leer/guardar
+`user_data.json` y al decodificar páginas de Notion.
+"""
+import sys
+from datetime import date
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Any
+
+
+@lru_cache(maxsize=4096)
+def parse_date(iso: str) -> date:
+    """Convierte 'YYYY-MM-DD' (o un datetime ISO) a date, reutilizando objetos ya creados."""
+    return date.fromisoformat(iso[:10])
+
+def intern_subject(name: str) -> str:
+    """Interna el nombre de una materia para compartir una sola copia en memoria."""
+    return sys.intern(name)
+
+
+class Exam:
+    """Examen o entrega obtenido desde Notion."""
+    __slots__ = ("titulo", "fecha", "materia", "contenido", "url")
+
+    def __init__(self, titulo: str, fecha: date, materia: str, contenido: str = "", url: str = ""):
+        self.titulo = titulo
+        self.fecha = fecha
+        self.materia = intern_subject(materia)
+        self.contenido = contenido
+        self.url = url
+
+    def days_left(self, today: date) -> int:
+        return (self.fecha - today).days
+
+    def __repr__(self):
+        return f"Exam({self.titulo!r}, {self.fecha.isoformat()!r}, {self.materia!r})"
+
+
+class Session(NamedTuple):
+    """Una sesión de estudio (inmutable y hashable: sirve directo como clave de índice)."""
+    date: date
+    subject: str
+
+    @classmethod
+    def from_json(cls, raw: Dict[str, Any]) -> "Session":
+        return cls(parse_date(raw["date"]), intern_subject(raw.get("subject", "General")))
+
+    def to_json(self) -> Dict[str, str]:
+        return {"date": self.date.isoformat(), "subject": self.subject}
+
+
+class UserRecord:
+    """
+    Datos de estudio de un usuario.
+    - goals: {materia: sesiones por semana}
+    - sessions: sesiones recientes en detalle
+    - history: {fecha: {materia: cantidad}} con las sesiones ya compactadas
+    Los slots que empiezan con "_" son cachés en memoria y no se guardan.
+    """
+    __slots__ = ("goals", "sessions", "history", "compacted_on", "_recent_index", "_columns", "_subject_index")
+
+    def __init__(self):
+        self.goals: Dict[str, int] = {}
+        self.sessions: List[Session] = []
+        self.history: Dict[date, Dict[str, int]] = {}
+        self.compacted_on: Optional[date] = None
+        self._recent_index = None
+        self._columns = None
+        self._subject_index = None
+
+    @classmethod
+    def from_json(cls, raw: Dict[str, Any]) -> "UserRecord":
+        record = cls()
+        record.goals = {intern_subject(k): v for k, v in raw.get("goals", {}).items()}
+        record.sessions = [Session.from_json(s) for s in raw.get("sessions", [])]
+        record.history = {
+            parse_date(day): {intern_subject(k): v for k, v in per_subject.items()}
+            for day, per_subject in raw.get("history", {}).items()
+        }
+        if raw.get("compacted_on"):
+            record.compacted_on = parse_date(raw["compacted_on"])
+        return record
+
+    def to_json(self) -> Dict[str, Any]:
+        raw: Dict[str, Any] = {
+            "goals": dict(self.goals),
+            "sessions": [s.to_json() for s in self.sessions],
+        }
+        if self.history:
+            raw["history"] = {day.isoformat(): dict(per_subject) for day, per_subject in sorted(self.history.items())}
+        if self.compacted_on:
+            raw["compacted_on"] = self.compacted_on.isoformat()
+        return raw
+
+    def invalidate_caches(self):
+        self._recent_index = None
+        self._columns = None
@@ -1,181 +1,505 @@
-
 import json
+import logging
 import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
 from datetime import date, datetime, timedelta
-from typing import Dict, Any, List
+from functools import wraps
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Set, Tuple
+
+from src.models import Session, UserRecord, intern_subject
+from src.utils.subjects import SubjectIndex, clean_subject
 
+# {id de usuario de Telegram: UserRecord}. Los handlers siempre pasan el id de la persona
+# (effective_user), no el del chat: en grupos cada quien tiene sus metas y sesiones.
 DATA_FILE = "user_data.json"
 
-def _load_data() -> Dict[str, Any]:
-    """Carga los datos del archivo JSON. Si no existe, devuelve dict vacío."""
-    if not os.path.exists(DATA_FILE):
+# Días de sesiones que se guardan en detalle. Las más antiguas se compactan en
+# contadores por día y materia ("history"). Debe cubrir al menos la semana actual.
+RETENTION_DAYS = 35
+
+# Copia en memoria del archivo, válida mientras no cambie su fecha de modificación
+_cache: Dict[str, Any] = {"mtime": None, "data": None}
+# Serializa el acceso a `_cache` y al archivo: la importación y la exportación corren en
+# hilos aparte (asyncio.to_thread) mientras el bot sigue registrando sesiones
+_lock = threading.RLock()
+
+# Funciones avisadas cada vez que se registra una sesión nueva: fn(chat_id, session)
+_session_listeners: List[Callable[[int, Session], None]] = []
+# Funciones avisadas tras importar historial (cambios en fechas pasadas): fn(chat_id)
+_history_listeners: List[Callable[[int], None]] = []
+
+# Índice de materias de referencia (las de los exámenes); lo provee exam_cache
+_reference_subjects: Callable[[], Optional[SubjectIndex]] = lambda: None
+
+# Tabla global de materias internadas: nombre <-> id entero
+_subject_ids: Dict[str, int] = {}
+_subject_names: List[str] = []
+
+def _synchronized(fn):
+    """Ejecuta `fn` con `_lock` tomado (lee y modifica el mismo `_cache`)."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with _lock:
+            return fn(*args, **kwargs)
+    return wrapper
+
+@_synchronized
+def _load_data() -> Dict[str, UserRecord]:
+    """
+    Carga los datos del archivo JSON como {chat_id: UserRecord}. Si no existe, devuelve dict vacío.
+    Este es el único punto donde se lee JSON; el resto del módulo trabaja con el modelo.
+    Los formatos antiguos ya fueron migrados al arrancar (ver migrations.py).
+    """
+    try:
+        mtime = os.path.getmtime(DATA_FILE)
+    except OSError:
         return {}
+    if _cache["mtime"] == mtime:
+        return _cache["data"]
     try:
         with open(DATA_FILE, "r") as f:
-            return json.load(f)
+            raw = json.load(f)
     except (json.JSONDecodeError, IOError):
         return {}
 
-def _save_data(data: Dict[str, Any]):
+    data = {chat_id: UserRecord.from_json(user_data) for chat_id, user_data in raw.items()}
+    _cache["mtime"] = mtime
+    _cache["data"] = data
+    return data
+
+@_synchronized
+def _save_data(data: Dict[str, UserRecord]):
     """Guarda (sobreescribe) el archivo JSON con los nuevos datos."""
     with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=2)
-
-def _migrate_data(data: Dict[str, Any]):
-    """
-    Sistema de Migración:
-    Asegura que los datos antiguos sean compatibles con las nuevas versiones del bot.
-    - Convierte metas simples (int) a diccionario separado por materia.
-    - Convierte sesiones simples (string fecha) a objetos detallados.
-    """
-    changed = False
-    for chat_id, user_data in data.items():
-        # Migrar Meta: de int a dict
-        if "study_goal" in user_data and isinstance(user_data["study_goal"], int):
-            old_goal = user_data.pop("study_goal")
-            if "goals" not in user_data:
-                user_data["goals"] = {}
-            if "General" not in user_data["goals"]:
-                user_data["goals"]["General"] = old_goal
-            changed = True
-            
-        # Migrar Sesiones: de list[str] a list[dict]
-        if "study_sessions" in user_data:
-            new_sessions = []
-            for s in user_data["study_sessions"]:
-                if isinstance(s, str):
-                    new_sessions.append({"date": s, "subject": "General"})
-                else:
-                    new_sessions.append(s)
-            user_data["sessions"] = new_sessions
-            user_data.pop("study_sessions")
-            changed = True
-            
-    if changed:
-        _save_data(data)
+        json.dump({chat_id: record.to_json() for chat_id, record in data.items()}, f, indent=2)
+    _cache["mtime"] = os.path.getmtime(DATA_FILE)
+    _cache["data"] = data
+
+def add_session_listener(listener: Callable[[int, Session], None]):
+    """Registra una función que se llama tras cada sesión nueva (ej. invalidar reportes)."""
+    _session_listeners.append(listener)
+
+def add_history_listener(listener: Callable[[int], None]):
+    """Registra una función que se llama tras importar sesiones a un usuario."""
+    _history_listeners.append(listener)
+
+def notify_history_changed(chat_id: int):
+    """
+    Avisa a los listeners de historial que cambiaron fechas pasadas de `chat_id`.
+    Lo llama quien importa, una vez al terminar y desde el hilo del bot.
+    """
+    for listener in _history_listeners:
+        try:
+            listener(chat_id)
+        except Exception as e:
+            logging.error(f"Error en listener de historial: {e}")
+
+def set_reference_subjects(provider: Callable[[], Optional[SubjectIndex]]):
+    """Define de dónde salen las materias de referencia para canonizar nombres nuevos."""
+    global _reference_subjects
+    _reference_subjects = provider
+
+def _compact_user(record: UserRecord, today: date) -> bool:
+    """
+    Mueve las sesiones más antiguas que RETENTION_DAYS a `history`:
+    {fecha: {materia: cantidad}}. Se ejecuta como máximo una vez al día por usuario.
+    Devuelve True si modificó los datos.
+    """
+    if record.compacted_on == today:
+        return False
+
+    cutoff = today - timedelta(days=RETENTION_DAYS)
+    recent = []
+    history = record.history
+    for s in record.sessions:
+        if s.date < cutoff:
+            day = history.setdefault(s.date, {})
+            day[s.subject] = day.get(s.subject, 0) + 1
+        else:
+            recent.append(s)
+    record.sessions = recent
+    record.compacted_on = today
+    record.invalidate_caches()
+    return True
+
+def _get_recent_index(record: UserRecord) -> Set[Session]:
+    """Devuelve (y construye si hace falta) el índice de las sesiones recientes."""
+    if record._recent_index is None:
+        record._recent_index = set(record.sessions)
+    return record._recent_index
+
+def _get_subject_index(record: UserRecord) -> SubjectIndex:
+    """Índice de las materias que el usuario ya usó (metas primero: su escritura manda)."""
+    if record._subject_index is None:
+        index = SubjectIndex(record.goals)
+        for s in record.sessions:
+            index.add(s.subject)
+        for per_subject in record.history.values():
+            for subj in per_subject:
+                index.add(subj)
+        record._subject_index = index
+    return record._subject_index
+
+def _canonical_subject(record: UserRecord, subject: str) -> str:
+    """
+    Nombre con que se guarda una materia: el ya conocido (del usuario o de los exámenes)
+    si coincide sin tildes, mayúsculas ni espacios extra; si no, el escrito.
+    Nunca se usa la coincidencia aproximada: "Cálculo II" no es "Cálculo I".
+    """
+    name = clean_subject(subject) or "General"
+    reference = _reference_subjects()
+    exact = _get_subject_index(record).get(name) or (reference.get(name) if reference else None)
+    return intern_subject(exact or name)
+
+@_synchronized
+def canonical_subject(chat_id: int, subject: str) -> str:
+    """Nombre canónico de `subject` para este usuario (lo que se guardaría al registrarlo)."""
+    record = _load_data().get(str(chat_id)) or UserRecord()
+    return _canonical_subject(record, subject)
+
+@_synchronized
+def suggest_subject(chat_id: int, subject: str) -> Optional[str]:
+    """
+    Materia conocida parecida a `subject` (ej. con un error de tipeo), solo para sugerirla.
+    None si `subject` ya es conocida o no hay una clara.
+    """
+    record = _load_data().get(str(chat_id)) or UserRecord()
+    own = _get_subject_index(record)
+    reference = _reference_subjects()
+    if subject in own or (reference is not None and subject in reference):
+        return None
+    return own.suggest(subject) or (reference.suggest(subject) if reference else None)
 
+@_synchronized
 def set_study_goal(chat_id: int, goal: int, subject: str = "General"):
     """Establece la meta semanal para una materia específica."""
     data = _load_data()
-    _migrate_data(data)
-    
+
     str_id = str(chat_id)
     if str_id not in data:
-        data[str_id] = {"goals": {}, "sessions": []}
-    
-    if "goals" not in data[str_id]:
-         data[str_id]["goals"] = {}
-         
-    data[str_id]["goals"][subject] = goal
+        data[str_id] = UserRecord()
+    record = data[str_id]
+
+    subject = _canonical_subject(record, subject)
+    record.goals[subject] = goal
+    _get_subject_index(record).add(subject)
     _save_data(data)
 
+@_synchronized
+def get_goals(chat_id: int) -> Dict[str, int]:
+    """Metas semanales del usuario: {materia: sesiones por semana}."""
+    record = _load_data().get(str(chat_id))
+    return dict(record.goals) if record else {}
+
 def log_study_session(chat_id: int, subject: str = "General") -> bool:
     """
     Registra una sesión de estudio para HOY.
     Devuelve True si es un nuevo registro, False si ya existía para hoy.
     """
+    with _lock:
+        data = _load_data()
+
+        str_id = str(chat_id)
+        today = date.today()
+
+        if str_id not in data:
+            data[str_id] = UserRecord()
+        record = data[str_id]
+
+        # Compactación periódica: mantiene acotada la lista de sesiones detalladas
+        _compact_user(record, today)
+        index = _get_recent_index(record)
+
+        # Evitar duplicados para la misma materia el mismo día
+        session = Session(today, _canonical_subject(record, subject))
+        if session in index:
+            return False
+
+        record.sessions.append(session)
+        index.add(session)
+        _get_subject_index(record).add(session.subject)
+        if record._columns is not None:
+            record._columns.append(today.toordinal(), session.subject)
+        _save_data(data)
+    for listener in _session_listeners:
+        try:
+            listener(chat_id, session)
+        except Exception as e:
+            logging.error(f"Error en listener de sesiones: {e}")
+    return True
+
+@_synchronized
+def import_sessions(chat_id: int, sessions: Iterable[Session]) -> Tuple[int, int]:
+    """
+    Agrega un lote de sesiones de cualquier fecha pasada con una sola escritura del archivo.
+    Las anteriores a RETENTION_DAYS van directo a `history`. Se mantiene la regla de una
+    sesión por materia y día. Devuelve (nuevas, duplicadas).
+    No avisa a los listeners: al terminar de importar, llamar a `notify_history_changed`.
+    """
     data = _load_data()
-    _migrate_data(data)
-    
+
     str_id = str(chat_id)
-    today_iso = date.today().isoformat()
-    
+    today = date.today()
     if str_id not in data:
-        data[str_id] = {"goals": {}, "sessions": []}
-        
-    sessions = data[str_id].get("sessions", [])
-    
-    # Evitar duplicados para la misma materia el mismo día
+        data[str_id] = UserRecord()
+    record = data[str_id]
+
+    _compact_user(record, today)
+    index = _get_recent_index(record)
+    cutoff = today - timedelta(days=RETENTION_DAYS)
+
+    subjects = _get_subject_index(record)
+    added = duplicates = 0
     for s in sessions:
-        if s["date"] == today_iso and s["subject"] == subject:
-            return False
-        
-    sessions.append({"date": today_iso, "subject": subject})
-    data[str_id]["sessions"] = sessions
-    _save_data(data)
-    return True
+        s = Session(s.date, _canonical_subject(record, s.subject))
+        subjects.add(s.subject)
+        if s.date < cutoff:
+            day = record.history.setdefault(s.date, {})
+            if day.get(s.subject):
+                duplicates += 1
+                continue
+            day[s.subject] = 1
+        else:
+            if s in index:
+                duplicates += 1
+                continue
+            record.sessions.append(s)
+            index.add(s)
+        added += 1
+
+    if added:
+        record.sessions.sort()
+        record._columns = None  # se reconstruye una vez, al próximo uso
+        _save_data(data)
+    return added, duplicates
 
+def iter_sessions(chat_id: int) -> Iterator[Session]:
+    """
+    Todas las sesiones del usuario en orden de fecha (las compactadas se expanden).
+    Recorre una copia tomada con el lock: la compactación puede mover sesiones a
+    `history` mientras se exporta. La copia es la forma compacta (contadores por día).
+    """
+    with _lock:
+        record = _load_data().get(str(chat_id))
+        if record is None:
+            return
+        history = [(day, list(record.history[day].items())) for day in sorted(record.history)]
+        sessions = sorted(record.sessions)
+    for day, per_subject in history:
+        for subj, count in per_subject:
+            for _ in range(count):
+                yield Session(day, subj)
+    yield from sessions
+
+@_synchronized
 def get_weekly_progress(chat_id: int) -> Dict[str, Any]:
     """Calcula el progreso de la semana actual por materia."""
     data = _load_data()
-    _migrate_data(data)
-    
-    str_id = str(chat_id)
-    user_data = data.get(str_id, {})
-    
-    goals = user_data.get("goals", {})
-    sessions = user_data.get("sessions", [])
-    
+
+    record = data.get(str(chat_id)) or UserRecord()
+
     # Calcular inicio y fin de la semana (Lunes a Domingo)
     today = date.today()
     start_of_week = today - timedelta(days=today.weekday())
     end_of_week = start_of_week + timedelta(days=6)
-    
+
     # Estructura de respuesta
     progress = {}
-    
+
     # Inicializar con las metas existentes
-    for subj, goal in goals.items():
+    for subj, goal in record.goals.items():
         progress[subj] = {"goal": goal, "current": 0, "percentage": 0}
-        
+
     # Contar sesiones que caen en esta semana
-    for s in sessions:
-        s_date = date.fromisoformat(s["date"])
-        subj = s.get("subject", "General")
-        
-        if start_of_week <= s_date <= end_of_week:
-            if subj not in progress:
-                 progress[subj] = {"goal": 0, "current": 0, "percentage": 0}
-            progress[subj]["current"] += 1
-            
+    for s in record.sessions:
+        if start_of_week <= s.date <= end_of_week:
+            if s.subject not in progress:
+                 progress[s.subject] = {"goal": 0, "current": 0, "percentage": 0}
+            progress[s.subject]["current"] += 1
+
     # Calcular porcentajes
     for subj in progress:
         g = progress[subj]["goal"]
         c = progress[subj]["current"]
         if g > 0:
             progress[subj]["percentage"] = int(c / g * 100)
-            
+
     return progress
 
-def get_current_streak(chat_id: int) -> int:
-    """Calcula la 'Racha' (días consecutivos estudiando) hasta hoy/ayer."""
-    data = _load_data()
-    _migrate_data(data)
-    
-    str_id = str(chat_id)
-    user_data = data.get(str_id, {})
-    sessions = user_data.get("sessions", [])
-    
-    # Obtener lista de fechas únicas ordenadas (más reciente primero)
-    dates = sorted(list(set([s["date"] for s in sessions])), reverse=True)
-    
-    if not dates:
+def _streak_from_dates(unique_dates: Set[date], today: date) -> int:
+    """Días consecutivos con estudio terminando hoy (o ayer, si hoy aún no se estudia)."""
+    if not unique_dates:
         return 0
-        
-    today_str = date.today().isoformat()
-    yesterday_str = (date.today() - timedelta(days=1)).isoformat()
-    
+
+    yesterday = today - timedelta(days=1)
+
     streak = 0
-    current_check = date.today()
-    
+    current_check = today
+
     # Verificar si la racha está viva (se estudió hoy o ayer)
     # Si la última sesión fue antes de ayer, la racha se rompió -> 0
-    last_session_date = dates[0]
-    if last_session_date != today_str and last_session_date != yesterday_str:
+    last_session_date = max(unique_dates)
+    if last_session_date != today and last_session_date != yesterday:
         return 0
-        
+
     # Contar hacia atrás
     # Si hoy no se ha estudiado aún, empezamos a contar desde ayer
-    if today_str not in dates:
-        current_check = date.today() - timedelta(days=1)
-    
+    if today not in unique_dates:
+        current_check = yesterday
+
     # Bucle de seguridad (max 365 días)
-    for _ in range(365): 
-        check_str = current_check.isoformat()
-        if check_str in dates:
+    for _ in range(365):
+        if current_check in unique_dates:
             streak += 1
             current_check -= timedelta(days=1)
         else:
             break
-            
+
     return streak
+
+def _study_dates(record: UserRecord) -> Set[date]:
+    # Incluye los días ya compactados en `history` para no cortar rachas largas
+    unique_dates = set([s.date for s in record.sessions])
+    unique_dates.update(record.history.keys())
+    return unique_dates
+
+@_synchronized
+def get_current_streak(chat_id: int) -> int:
+    """Calcula la 'Racha' (días consecutivos estudiando) hasta hoy/ayer."""
+    data = _load_data()
+
+    record = data.get(str(chat_id)) or UserRecord()
+    return _streak_from_dates(_study_dates(record), date.today())
+
+@_synchronized
+def get_activity_snapshot(chat_id: int, today: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Resumen para rankings, con una sola lectura del archivo:
+    {"week_sessions": sesiones de esta semana, "streak": racha, "last_day": último día con estudio}
+    """
+    record = _load_data().get(str(chat_id)) or UserRecord()
+    today = today or date.today()
+    start_of_week = today - timedelta(days=today.weekday())
+    unique_dates = _study_dates(record)
+    return {
+        "week_sessions": sum(1 for s in record.sessions if start_of_week <= s.date <= today),
+        "streak": _streak_from_dates(unique_dates, today),
+        "last_day": max(unique_dates) if unique_dates else None,
+    }
+
+@_synchronized
+def get_total_sessions(chat_id: int) -> Dict[str, int]:
+    """Total histórico de sesiones por materia (detalladas + compactadas)."""
+    data = _load_data()
+
+    record = data.get(str(chat_id)) or UserRecord()
+    totals: Dict[str, int] = {}
+    for s in record.sessions:
+        totals[s.subject] = totals.get(s.subject, 0) + 1
+    for day in record.history.values():
+        for subj, count in day.items():
+            totals[subj] = totals.get(subj, 0) + count
+    return totals
+
+# --- Historial en columnas ---
+
+def _intern_subject(name: str) -> int:
+    """Devuelve el id entero de una materia, registrándola si es nueva."""
+    sid = _subject_ids.get(name)
+    if sid is None:
+        sid = len(_subject_names)
+        _subject_ids[name] = sid
+        _subject_names.append(name)
+    return sid
+
+class SessionColumns:
+    """
+    Historial de un usuario en formato columnar, ordenado por día:
+    `days` guarda el ordinal de la fecha y `subjects` el id internado de la materia.
+    Cada posición es una sesión (los contadores de `history` se expanden).
+    """
+    __slots__ = ("days", "subjects")
+
+    def __init__(self):
+        self.days = array("i")
+        self.subjects = array("I")
+
+    @classmethod
+    def from_record(cls, record: UserRecord) -> "SessionColumns":
+        rows = []
+        for day, per_subject in record.history.items():
+            ordinal = day.toordinal()
+            for subj, count in per_subject.items():
+                rows.extend([(ordinal, _intern_subject(subj))] * count)
+        for s in record.sessions:
+            rows.append((s.date.toordinal(), _intern_subject(s.subject)))
+        rows.sort()
+
+        columns = cls()
+        columns.days.extend([r[0] for r in rows])
+        columns.subjects.extend([r[1] for r in rows])
+        return columns
+
+    def append(self, ordinal: int, subject: str):
+        """Agrega una sesión manteniendo el orden por día."""
+        pos = bisect_right(self.days, ordinal)
+        self.days.insert(pos, ordinal)
+        self.subjects.insert(pos, _intern_subject(subject))
+
+    def _span(self, start: int, end: int) -> Tuple[int, int]:
+        """Rango [lo, hi) de posiciones con start <= día <= end."""
+        return bisect_left(self.days, start), bisect_right(self.days, end)
+
+    def count_by_day(self, start: int, end: int) -> Counter:
+        lo, hi = self._span(start, end)
+        return Counter(self.days[lo:hi])
+
+    def count_by_subject(self, start: int, end: int) -> Counter:
+        lo, hi = self._span(start, end)
+        return Counter(self.subjects[lo:hi])
+
+def _get_columns(record: UserRecord) -> SessionColumns:
+    if record._columns is None:
+        record._columns = SessionColumns.from_record(record)
+    return record._columns
+
+@_synchronized
+def get_history_stats(chat_id: int, today: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Estadísticas del último año para /historial:
+    - "days": {fecha: sesiones} de los últimos 12 meses (solo días con actividad)
+    - "subjects": {materia: {"recent": prom. semanal últimas 4 semanas,
+                             "previous": prom. semanal 4 semanas anteriores, "total": del año}}
+    - "total": sesiones del año
+    """
+    data = _load_data()
+
+    columns = _get_columns(data.get(str(chat_id)) or UserRecord())
+
+    today = today or date.today()
+    end = today.toordinal()
+    year_start = end - 364
+    recent_start = end - 27
+    previous_start = end - 55
+
+    per_day = columns.count_by_day(year_start, end)
+    year = columns.count_by_subject(year_start, end)
+    recent = columns.count_by_subject(recent_start, end)
+    previous = columns.count_by_subject(previous_start, recent_start - 1)
+
+    subjects = {}
+    for sid, total in year.items():
+        subjects[_subject_names[sid]] = {
+            "recent": recent.get(sid, 0) / 4,
+            "previous": previous.get(sid, 0) / 4,
+            "total": total,
+        }
+
+    return {
+        "days": {date.fromordinal(o): c for o, c in per_day.items()},
+        "subjects": subjects,
+        "total": sum(per_day.values()),
+    }
@@ -0,0 +1,192 @@
+"""
+Caché en proceso de los exámenes de Notion y vistas derivadas.
+
+- `refresh()` consulta Notion (lo llama un job periódico, fuera del loop de eventos)
+  y solo cambia la versión de los datos si algo realmente cambió.
+- `imminent()` devuelve la vista de exámenes próximos (ordenada por fecha, con los
+  días restantes ya calculados). `refresh()` la arma al cambiar los datos y
+  `imminent()` solo la rehace (sin consultar Notion) al cambiar el día, así que el
+  chequeo de cada minuto lee una estructura lista.
+- `subjects` indexa las materias de los exámenes (búsqueda aproximada) y se
+  reconstruye junto con los datos; `search()` lo usa para /proximos.
+- Si Notion falla, se espera antes de volver a consultarlo (lo que indique su
+  Retry-After, o EXAM_CACHE_RETRY segundos, el doble tras cada fallo seguido y
+  como máximo el TTL). Mientras tanto se sirven los últimos exámenes buenos.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_right
+from datetime import date
+from typing import Callable, Dict, FrozenSet, List, Optional
+
+from src.models import Exam
+from src.services.notion_service import NotionClient, NotionError
+from src.services.data_service import set_reference_subjects
+from src.services.subscription_service import MAX_ALERT_DAYS
+from src.utils import metrics
+from src.utils.subjects import SubjectIndex, exam_subjects, normalize_subject
+
+# Antigüedad máxima de los datos antes de volver a consultar Notion (segundos)
+EXAM_CACHE_TTL = int(os.getenv("EXAM_CACHE_TTL", "600"))
+# Espera tras el primer fallo de Notion antes de reintentar (segundos)
+EXAM_CACHE_RETRY = int(os.getenv("EXAM_CACHE_RETRY", "30"))
+
+
+class ImminentView:
+    """Exámenes entre hoy y hoy+max_days, ordenados por fecha, con datos precalculados."""
+    __slots__ = ("day", "exams", "days_left", "subjects", "all_subjects", "_cuts")
+
+    def __init__(self, exams: List[Exam], today: date, max_days: int = MAX_ALERT_DAYS):
+        selected = sorted(
+            (e for e in exams if 0 <= e.days_left(today) <= max_days),
+            key=lambda e: e.fecha
+        )
+        self.day = today
+        self.exams = selected
+        self.days_left = [e.days_left(today) for e in selected]
+        self.subjects: List[FrozenSet[str]] = [frozenset(exam_subjects(e.materia)) for e in selected]
+        self.all_subjects: FrozenSet[str] = frozenset().union(*self.subjects)
+        # _cuts[d] = cuántos exámenes caen dentro de los próximos d días
+        self._cuts = [bisect_right(self.days_left, d) for d in range(max_days + 1)]
+
+    def count_within(self, days: int) -> int:
+        """Cantidad de exámenes con days_left <= days (los primeros de la lista)."""
+        return self._cuts[max(0, min(days, len(self._cuts) - 1))]
+
+    def __len__(self):
+        return len(self.exams)
+
+
+class ExamCache:
+    """Última lista de exámenes obtenida de Notion, con versión y avisos de cambio."""
+
+    def __init__(self, ttl: int = EXAM_CACHE_TTL):
+        self.ttl = ttl
+        self.version = 0
+        self._exams: List[Exam] = []
+        self._fingerprint = None
+        self._fetched_at: Optional[float] = None
+        self._retry_at: Optional[float] = None
+        self._failures = 0
+        self._last_error: Optional[Exception] = None
+        self._view: Optional[ImminentView] = None
+        self.subjects = SubjectIndex()
+        self._by_subject: Dict[str, List[Exam]] = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._listeners: List[Callable[[List[Exam]], None]] = []
+
+    def add_listener(self, listener: Callable[[List[Exam]], None]):
+        """fn(exams) se llama cada vez que cambian los datos de Notion."""
+        self._listeners.append(listener)
+
+    @property
+    def is_stale(self) -> bool:
+        return self._fetched_at is None or time.monotonic() - self._fetched_at > self.ttl
+
+    @property
+    def in_backoff(self) -> bool:
+        """True mientras se espera tras un fallo de Notion (no se vuelve a consultar)."""
+        return self._retry_at is not None and time.monotonic() < self._retry_at
+
+    def _record_failure(self, error: Exception):
+        self._failures += 1
+        delay = getattr(error, "retry_after", None) or min(EXAM_CACHE_RETRY * 2 ** (self._failures - 1), self.ttl)
+        self._retry_at = time.monotonic() + delay
+        self._last_error = error
+        metrics.incr("notion.failures")
+        logging.warning(f"Notion falló ({self._failures} seguidas); próximo intento en {delay:.0f} s: {error}")
+
+    def refresh(self) -> bool:
+        """
+        Consulta Notion (bloqueante). Devuelve True si los datos cambiaron.
+        Si falla, programa la espera antes del próximo intento y relanza el error.
+        """
+        metrics.incr("notion.queries")
+        try:
+            exams = NotionClient().get_upcoming_exams()
+        except Exception as e:
+            self._record_failure(e)
+            raise
+        self._failures = 0
+        self._retry_at = None
+        self._last_error = None
+        fingerprint = tuple((e.titulo, e.fecha, e.materia, e.contenido, e.url) for e in exams)
+        if fingerprint == self._fingerprint:
+            self._fetched_at = time.monotonic()
+            return False
+
+        subjects = SubjectIndex()
+        by_subject: Dict[str, List[Exam]] = {}
+        for e in exams:
+            for part in e.materia.split(","):
+                if part.strip():
+                    subjects.add(" ".join(part.split()))
+            for key in exam_subjects(e.materia):
+                by_subject.setdefault(key, []).append(e)
+        view = ImminentView(exams, date.today())
+        with self._lock:
+            self._fetched_at = time.monotonic()
+            self._exams = exams
+            self.subjects = subjects
+            self._by_subject = by_subject
+            self._fingerprint = fingerprint
+            self.version += 1
+            self._view = view
+        logging.info(f"Exámenes actualizados desde Notion (versión {self.version}, {len(exams)} exámenes).")
+        for listener in self._listeners:
+            try:
+                listener(exams)
+            except Exception as e:
+                logging.error(f"Error en listener de exámenes: {e}")
+        return True
+
+    def get_exams(self) -> List[Exam]:
+        """
+        Exámenes en caché; consulta Notion solo si nunca se cargaron o están vencidos.
+        Si varios pedidos los encuentran vencidos a la vez, solo uno consulta.
+        Si Notion falla (o se está esperando tras un fallo), devuelve los últimos
+        exámenes buenos; solo lanza NotionError si nunca se pudieron cargar.
+        """
+        if self.is_stale and not self.in_backoff:
+            with self._refresh_lock:
+                if self.is_stale and not self.in_backoff:
+                    try:
+                        self.refresh()
+                    except Exception:
+                        pass  # ya quedó registrado en _record_failure
+        if self._fetched_at is None:
+            raise NotionError(f"Notion no disponible: {self._last_error}")
+        if self.is_stale:
+            metrics.incr("exam_cache.stale_served")
+        return self._exams
+
+    def search(self, query: str) -> List[Exam]:
+        """Exámenes cuya materia se parece a `query` (sin tildes, mayúsculas ni typos), por fecha."""
+        self.get_exams()
+        found = {}
+        for name, _ in self.subjects.search(query, limit=len(self.subjects)):
+            for e in self._by_subject.get(normalize_subject(name), ()):
+                found[id(e)] = e
+        return sorted(found.values(), key=lambda e: e.fecha)
+
+    def imminent(self, today: Optional[date] = None) -> ImminentView:
+        """
+        Vista de exámenes próximos con los datos en caché (nunca consulta Notion: si aún
+        no hay datos, la vista está vacía). Se rehace aquí solo si cambió el día.
+        """
+        today = today or date.today()
+        view = self._view
+        if view is None or view.day != today:
+            view = ImminentView(self._exams, today)
+            self._view = view
+        return view
+
+
+# Instancia compartida por el scheduler y los handlers
+exam_cache = ExamCache()
+
+# Las materias de Notion sirven de referencia al canonizar lo que escriben los usuarios
+set_reference_subjects(lambda: exam_cache.subjects)
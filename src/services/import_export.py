@@ -0,0 +1,193 @@
+"""
+Importación y exportación del historial de estudio.
+
+Todo pasa por un pipeline de generadores, así la memoria no crece con el tamaño
+del archivo:
+    líneas -> registros (CSV / JSON) -> sesiones válidas -> lotes -> data_service
+La exportación recorre el historial con `iter_sessions` y va escribiendo cada fila.
+
+Formatos aceptados:
+- CSV con encabezado `fecha,materia` (o `date,subject`).
+- JSON Lines (un objeto por línea) o un arreglo JSON de objetos
+  `{"fecha": "YYYY-MM-DD", "materia": "..."}` (o `date` / `subject`).
+
+Uso offline:
+    python -m src.services.import_export importar <chat_id> <archivo>
+    python -m src.services.import_export exportar <chat_id> [archivo.csv|.jsonl]
+"""
+import csv
+import io
+import json
+import logging
+import sys
+from datetime import date
+from itertools import islice
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional
+
+from src.models import Session, parse_date, intern_subject
+from src.services.data_service import import_sessions, iter_sessions, notify_history_changed
+from src.services.migrations import run_migrations
+
+IMPORT_BATCH_SIZE = 500
+MAX_SUBJECT_LENGTH = 64
+JSON_CHUNK_SIZE = 64 * 1024
+
+DATE_KEYS = ("fecha", "date")
+SUBJECT_KEYS = ("materia", "subject")
+
+
+def _field(record: Dict[str, Any], keys) -> Optional[Any]:
+    for key in keys:
+        if record.get(key):
+            return record[key]
+    return None
+
+def iter_csv_records(stream: IO[str]) -> Iterator[Dict[str, Any]]:
+    """Filas de un CSV con encabezado, como dicts con claves en minúscula."""
+    for row in csv.DictReader(stream):
+        yield {(k or "").strip().lower(): (v or "").strip() for k, v in row.items()}
+
+def iter_json_records(stream: IO[str]) -> Iterator[Dict[str, Any]]:
+    """Objetos de un JSON Lines o de un arreglo JSON, leyendo el archivo por bloques."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+    while True:
+        # Saltar espacios y separadores del arreglo
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,[]":
+            pos += 1
+        if pos >= len(buffer) and eof:
+            return
+        try:
+            obj, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError(f"JSON inválido cerca de: {buffer[pos:pos + 40]!r}")
+            chunk = stream.read(JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        pos = end
+        if isinstance(obj, dict):
+            yield obj
+
+def iter_valid_sessions(records: Iterable[Dict[str, Any]], stats: Dict[str, int],
+                        today: Optional[date] = None) -> Iterator[Session]:
+    """Convierte registros en sesiones; cuenta en `stats["invalid"]` los que no sirven."""
+    today = today or date.today()
+    for record in records:
+        raw_date = _field(record, DATE_KEYS)
+        subject = _field(record, SUBJECT_KEYS) or "General"
+        try:
+            day = parse_date(str(raw_date))
+        except (TypeError, ValueError):
+            stats["invalid"] += 1
+            continue
+        subject = " ".join(str(subject).split())[:MAX_SUBJECT_LENGTH]
+        if day > today or not subject:
+            stats["invalid"] += 1
+            continue
+        yield Session(day, intern_subject(subject))
+
+def batched(items: Iterable[Session], size: int) -> Iterator[List[Session]]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def import_stream(chat_id: int, stream: IO[str], fmt: str, batch_size: int = IMPORT_BATCH_SIZE,
+                  notify: bool = True) -> Dict[str, int]:
+    """
+    Importa un archivo abierto en modo texto ("csv" o "json").
+    Devuelve {"imported", "duplicates", "invalid"}.
+    Con `notify=False` no avisa a los listeners de historial (el bot lo hace desde su
+    hilo, porque la importación corre en otro).
+    """
+    records = iter_csv_records(stream) if fmt == "csv" else iter_json_records(stream)
+    stats = {"imported": 0, "duplicates": 0, "invalid": 0}
+    try:
+        for batch in batched(iter_valid_sessions(records, stats), batch_size):
+            added, duplicates = import_sessions(chat_id, batch)
+            stats["imported"] += added
+            stats["duplicates"] += duplicates
+    finally:
+        # Aunque falle a mitad, los lotes ya guardados cuentan
+        if notify and stats["imported"]:
+            notify_history_changed(chat_id)
+    logging.info(f"Historial importado: {stats}", extra={"chat_id": chat_id, "count": stats["imported"]})
+    return stats
+
+def format_for(filename: str) -> Optional[str]:
+    """Formato según la extensión del archivo ("csv", "json" o None si no se reconoce)."""
+    name = filename.lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".json", ".jsonl")):
+        return "json"
+    return None
+
+def iter_export_lines(chat_id: int, fmt: str = "csv") -> Iterator[str]:
+    """Líneas del historial exportado, generadas a medida que se recorre."""
+    if fmt == "csv":
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(("fecha", "materia"))
+        yield out.getvalue()
+        for s in iter_sessions(chat_id):
+            out.seek(0)
+            out.truncate()
+            writer.writerow((s.date.isoformat(), s.subject))
+            yield out.getvalue()
+    else:
+        for s in iter_sessions(chat_id):
+            yield json.dumps({"fecha": s.date.isoformat(), "materia": s.subject}, ensure_ascii=False) + "\n"
+
+def export_to(chat_id: int, stream: IO[str], fmt: str = "csv") -> int:
+    """Escribe el historial en `stream`. Devuelve cuántas sesiones exportó."""
+    lines = 0
+    for line in iter_export_lines(chat_id, fmt):
+        stream.write(line)
+        lines += 1
+    return lines - 1 if fmt == "csv" else lines
+
+
+def _main(argv: List[str]) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m src.services.import_export",
+                                     description="Importa o exporta el historial de estudio de un usuario.")
+    sub = parser.add_subparsers(dest="action", required=True)
+    p_import = sub.add_parser("importar", help="Carga sesiones desde un CSV o JSON")
+    p_import.add_argument("chat_id", type=int)
+    p_import.add_argument("archivo")
+    p_export = sub.add_parser("exportar", help="Escribe el historial (CSV por defecto, JSON Lines si termina en .json/.jsonl)")
+    p_export.add_argument("chat_id", type=int)
+    p_export.add_argument("archivo", nargs="?", help="Sin archivo: CSV por la salida estándar")
+    args = parser.parse_args(argv)
+    run_migrations()
+
+    if args.action == "importar":
+        fmt = format_for(args.archivo)
+        if fmt is None:
+            parser.error("El archivo debe ser .csv, .json o .jsonl")
+        with open(args.archivo, "r", encoding="utf-8-sig", newline="") as f:
+            stats = import_stream(args.chat_id, f, fmt)
+        print(f"Importadas: {stats['imported']} | Duplicadas: {stats['duplicates']} | Inválidas: {stats['invalid']}")
+        return 0
+
+    if not args.archivo:
+        export_to(args.chat_id, sys.stdout)
+        return 0
+    fmt = format_for(args.archivo) or "csv"
+    with open(args.archivo, "w", encoding="utf-8", newline="") as f:
+        count = export_to(args.chat_id, f, fmt)
+    print(f"Exportadas {count} sesiones a {args.archivo}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
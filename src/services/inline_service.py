@@ -0,0 +1,105 @@
+"""
+Modo inline (`@bot cálculo` desde cualquier chat).
+
+Los resultados salen de la caché de exámenes, nunca de Notion: cada vez que
+cambian los datos (listener de exam_cache) se arman de una vez los artículos de
+todos los exámenes y se agrupan por materia. Responder una consulta es buscar
+la materia en el índice aproximado y juntar listas ya armadas.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Tuple
+
+from telegram import InlineQueryResultArticle, InputTextMessageContent
+from telegram.constants import ParseMode
+
+from src.models import Exam
+from src.utils.subjects import exam_subjects, normalize_subject
+
+# Telegram acepta hasta 50 resultados por respuesta
+MAX_INLINE_RESULTS = 50
+# Segundos que Telegram puede reutilizar una respuesta (los resultados son iguales para todos)
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "60"))
+# Consultas de un mismo usuario más seguidas que esto esperan y se descartan si llega otra
+INLINE_DEBOUNCE = float(os.getenv("INLINE_DEBOUNCE", "0.15"))
+INLINE_MAX_USERS = 5000
+
+WEEKDAY_NAMES = ("lun", "mar", "mié", "jue", "vie", "sáb", "dom")
+
+
+class InlineIndex:
+    """Artículos inline precalculados: todos por fecha y por materia normalizada."""
+
+    def __init__(self, render: Callable[[Exam], str]):
+        self.render = render
+        self.upcoming: List[InlineQueryResultArticle] = []
+        self.by_subject: Dict[str, List[InlineQueryResultArticle]] = {}
+        self._lock = threading.Lock()
+
+    def _article(self, exam: Exam) -> InlineQueryResultArticle:
+        key = f"{exam.titulo}|{exam.fecha.isoformat()}|{exam.materia}"
+        when = f"{WEEKDAY_NAMES[exam.fecha.weekday()]} {exam.fecha.strftime('%d-%m-%Y')}"
+        return InlineQueryResultArticle(
+            id=hashlib.md5(key.encode()).hexdigest(),
+            title=f"{exam.materia}: {exam.titulo}",
+            description=f"⏰ {when}" + (f" · {exam.contenido}" if exam.contenido else ""),
+            input_message_content=InputTextMessageContent(
+                self.render(exam), parse_mode=ParseMode.MARKDOWN_V2, disable_web_page_preview=True
+            ),
+        )
+
+    def rebuild(self, exams: List[Exam]):
+        """Arma todos los artículos (se llama desde el hilo que refresca la caché)."""
+        upcoming = []
+        by_subject: Dict[str, List[InlineQueryResultArticle]] = {}
+        for exam in sorted(exams, key=lambda e: e.fecha):
+            article = self._article(exam)
+            upcoming.append(article)
+            for key in exam_subjects(exam.materia):
+                by_subject.setdefault(key, []).append(article)
+        with self._lock:
+            self.upcoming = upcoming
+            self.by_subject = by_subject
+
+    def results(self, subject_names: List[str]) -> List[InlineQueryResultArticle]:
+        """Artículos de las materias dadas (ya ordenadas por relevancia), sin repetir."""
+        seen = set()
+        found = []
+        for name in subject_names:
+            for article in self.by_subject.get(normalize_subject(name), ()):
+                if article.id not in seen:
+                    seen.add(article.id)
+                    found.append(article)
+                    if len(found) >= MAX_INLINE_RESULTS:
+                        return found
+        return found
+
+
+class InlineDebouncer:
+    """
+    Por usuario: la primera consulta pasa de inmediato; las que llegan antes de
+    `window` segundos desde la anterior esperan lo que falta y se descartan si
+    entretanto llegó otra (Telegram solo muestra la última).
+    """
+
+    def __init__(self, window: float = INLINE_DEBOUNCE, max_users: int = INLINE_MAX_USERS):
+        self.window = window
+        self.max_users = max_users
+        self._last: "OrderedDict[int, Tuple[int, float]]" = OrderedDict()  # user_id -> (secuencia, momento)
+
+    def register(self, user_id: int) -> Tuple[int, float]:
+        """Registra una consulta. Devuelve (secuencia, segundos a esperar antes de responder)."""
+        now = time.monotonic()
+        seq, last = self._last.get(user_id, (0, float("-inf")))
+        seq += 1
+        self._last[user_id] = (seq, now)
+        self._last.move_to_end(user_id)
+        if len(self._last) > self.max_users:
+            self._last.popitem(last=False)
+        return seq, max(0.0, self.window - (now - last))
+
+    def is_latest(self, user_id: int, seq: int) -> bool:
+        return self._last.get(user_id, (seq, 0))[0] == seq
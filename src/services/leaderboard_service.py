@@ -0,0 +1,238 @@
+"""
+Rankings de grupos (/ranking): sesiones de la semana y racha de cada integrante.
+
+- Los integrantes de cada grupo se registran al usar comandos en el grupo y se
+  guardan en GROUPS_FILE: {group_id: {user_id: nombre}}.
+- Cada grupo mantiene en memoria el puntaje de sus integrantes y un top-K ya
+  ordenado por métrica. Cada sesión nueva (listener de data_service) actualiza
+  solo los grupos del usuario, en O(K); pedir el ranking es leer el top-K.
+- Dentro de un día los puntajes solo suben, así que un top-K acotado es exacto.
+  Al cambiar el día se cortan las rachas vencidas y el lunes se reinicia la
+  semana; en ambos casos se reconstruye el top desde los puntajes (una vez al día).
+- El estado de un grupo se arma desde data_service la primera vez que se usa
+  (por ejemplo, tras reiniciar el bot).
+"""
+import heapq
+import json
+import logging
+import os
+from bisect import bisect_left, insort
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from src.models import Session
+from src.services.data_service import get_activity_snapshot, add_session_listener, add_history_listener
+
+GROUPS_FILE = "groups.json"
+
+# Cantidad de puestos que se mantienen y muestran por ranking
+RANKING_SIZE = int(os.getenv("RANKING_SIZE", "10"))
+
+METRICS = ("week", "streak")
+
+
+class TopK:
+    """Los K mayores puntajes como lista ordenada de (-puntaje, user_id)."""
+    __slots__ = ("k", "entries", "members")
+
+    def __init__(self, k: int):
+        self.k = k
+        self.entries: List[Tuple[int, str]] = []
+        self.members: Set[str] = set()
+
+    def update(self, user_id: str, old: int, new: int):
+        """Aplica una subida de puntaje (old -> new) de un usuario. O(K)."""
+        if user_id in self.members:
+            del self.entries[bisect_left(self.entries, (-old, user_id))]
+        elif len(self.entries) >= self.k and -new >= self.entries[-1][0]:
+            return  # no supera al último del top
+        insort(self.entries, (-new, user_id))
+        self.members.add(user_id)
+        if len(self.entries) > self.k:
+            _, dropped = self.entries.pop()
+            self.members.discard(dropped)
+
+    def rebuild(self, scores: Dict[str, int]):
+        self.entries = sorted(heapq.nsmallest(self.k, ((-v, uid) for uid, v in scores.items() if v > 0)))
+        self.members = {uid for _, uid in self.entries}
+
+    def items(self) -> List[Tuple[str, int]]:
+        return [(uid, -score) for score, uid in self.entries]
+
+
+class GroupBoard:
+    """Puntajes de los integrantes de un grupo y sus top-K por métrica."""
+    __slots__ = ("week", "streak", "last_day", "tops")
+
+    def __init__(self, k: int = RANKING_SIZE):
+        self.week: Dict[str, int] = {}
+        self.streak: Dict[str, int] = {}
+        self.last_day: Dict[str, Optional[date]] = {}
+        self.tops = {metric: TopK(k) for metric in METRICS}
+
+    def add_member(self, user_id: str, week: int, streak: int, last_day: Optional[date]):
+        self.week[user_id] = week
+        self.streak[user_id] = streak
+        self.last_day[user_id] = last_day
+        if week:
+            self.tops["week"].update(user_id, 0, week)
+        if streak:
+            self.tops["streak"].update(user_id, 0, streak)
+
+    def reset_member(self, user_id: str, week: int, streak: int, last_day: Optional[date]):
+        """Reemplaza los puntajes de un integrante (ej. tras importar historial) y rearma los top."""
+        self.week[user_id] = week
+        self.streak[user_id] = streak
+        self.last_day[user_id] = last_day
+        for metric in METRICS:
+            self.tops[metric].rebuild(getattr(self, metric))
+
+    def remove_member(self, user_id: str):
+        for scores in (self.week, self.streak, self.last_day):
+            scores.pop(user_id, None)
+        for metric in METRICS:
+            self.tops[metric].rebuild(getattr(self, metric))
+
+    def record_session(self, user_id: str, day: date):
+        """Una sesión nueva: +1 en la semana y la racha avanza si es el primer registro del día."""
+        if user_id not in self.week:
+            return
+        old = self.week[user_id]
+        self.week[user_id] = old + 1
+        self.tops["week"].update(user_id, old, old + 1)
+
+        last = self.last_day[user_id]
+        if last == day:
+            return
+        old = self.streak[user_id]
+        new = old + 1 if last == day - timedelta(days=1) else 1
+        self.streak[user_id] = new
+        self.last_day[user_id] = day
+        if new > old:
+            self.tops["streak"].update(user_id, old, new)
+        else:
+            self.tops["streak"].rebuild(self.streak)
+
+    def rollover(self, today: date, new_week: bool):
+        """Corta las rachas vencidas y, si empieza la semana, reinicia las sesiones semanales."""
+        yesterday = today - timedelta(days=1)
+        for uid, last in self.last_day.items():
+            if last is None or last < yesterday:
+                self.streak[uid] = 0
+        self.tops["streak"].rebuild(self.streak)
+        if new_week:
+            self.week = dict.fromkeys(self.week, 0)
+            self.tops["week"].rebuild(self.week)
+
+
+# Integrantes por grupo (persistido) e índice inverso usuario -> grupos
+_members: Optional[Dict[str, Dict[str, str]]] = None
+_user_groups: Dict[str, Set[str]] = {}
+# Rankings en memoria, armados al primer uso de cada grupo
+_boards: Dict[str, GroupBoard] = {}
+_board_day: Optional[date] = None
+
+def _load_members() -> Dict[str, Dict[str, str]]:
+    global _members
+    if _members is None:
+        _members = {}
+        if os.path.exists(GROUPS_FILE):
+            try:
+                with open(GROUPS_FILE, "r") as f:
+                    _members = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                logging.error(f"No se pudo leer {GROUPS_FILE}: {e}")
+        for gid, members in _members.items():
+            for uid in members:
+                _user_groups.setdefault(uid, set()).add(gid)
+    return _members
+
+def _save_members():
+    with open(GROUPS_FILE, "w") as f:
+        json.dump(_members, f, indent=2)
+
+def _current_day() -> date:
+    """Día al que corresponden los puntajes en memoria (lo avanza `rollover`)."""
+    global _board_day
+    if _board_day is None:
+        _board_day = date.today()
+    return _board_day
+
+def _get_board(group_id: str) -> GroupBoard:
+    board = _boards.get(group_id)
+    if board is None:
+        board = GroupBoard()
+        for uid in _load_members().get(group_id, {}):
+            snap = get_activity_snapshot(int(uid), _current_day())
+            board.add_member(uid, snap["week_sessions"], snap["streak"], snap["last_day"])
+        _boards[group_id] = board
+    return board
+
+def track_member(group_id: int, user_id: int, name: str):
+    """Registra (o renombra) a un integrante del grupo. Solo escribe si algo cambió."""
+    gid, uid = str(group_id), str(user_id)
+    members = _load_members().setdefault(gid, {})
+    if members.get(uid) == name:
+        return
+    is_new = uid not in members
+    members[uid] = name
+    _save_members()
+    if is_new:
+        _user_groups.setdefault(uid, set()).add(gid)
+        board = _boards.get(gid)
+        if board is not None:
+            snap = get_activity_snapshot(user_id, _current_day())
+            board.add_member(uid, snap["week_sessions"], snap["streak"], snap["last_day"])
+
+def untrack_member(group_id: int, user_id: int):
+    """Saca a un integrante que dejó el grupo."""
+    gid, uid = str(group_id), str(user_id)
+    members = _load_members().get(gid, {})
+    if members.pop(uid, None) is None:
+        return
+    _save_members()
+    _user_groups.get(uid, set()).discard(gid)
+    board = _boards.get(gid)
+    if board is not None:
+        board.remove_member(uid)
+
+def get_ranking(group_id: int, metric: str = "week") -> List[Tuple[str, int]]:
+    """Top del grupo como [(nombre, puntaje), ...], de mayor a menor. O(K)."""
+    gid = str(group_id)
+    names = _load_members().get(gid, {})
+    return [(names.get(uid, uid), score) for uid, score in _get_board(gid).tops[metric].items()]
+
+def rollover(today: Optional[date] = None):
+    """Cambio de día (job de medianoche): vence rachas y reinicia la semana el lunes."""
+    global _board_day
+    today = today or date.today()
+    previous = _current_day()
+    if today <= previous:
+        return
+    new_week = today.isocalendar()[:2] != previous.isocalendar()[:2]
+    _board_day = today
+    for board in _boards.values():
+        board.rollover(today, new_week)
+
+def _on_session_logged(chat_id: int, session: Session):
+    uid = str(chat_id)
+    rollover(session.date)  # por si la sesión llega antes que el job de medianoche
+    _load_members()
+    for gid in _user_groups.get(uid, ()):
+        board = _boards.get(gid)
+        if board is not None:
+            board.record_session(uid, session.date)
+
+def _on_history_imported(chat_id: int):
+    """Una importación puede cambiar fechas pasadas: se recalcula el integrante desde data_service."""
+    uid = str(chat_id)
+    _load_members()
+    boards = [_boards[gid] for gid in _user_groups.get(uid, ()) if gid in _boards]
+    if not boards:
+        return
+    snap = get_activity_snapshot(chat_id, _current_day())
+    for board in boards:
+        board.reset_member(uid, snap["week_sessions"], snap["streak"], snap["last_day"])
+
+add_session_listener(_on_session_logged)
+add_history_listener(_on_history_imported)
@@ -0,0 +1,112 @@
+"""
+Migraciones versionadas de los archivos de datos.
+
+Cada archivo tiene una lista ordenada de pasos; la versión aplicada se guarda en
+SCHEMA_VERSION_FILE ({"user_data.json": 2, "chat_ids.json": 1}). `run_migrations()`
+se ejecuta una vez al arrancar (bot o CLI): si un archivo está atrasado, lo
+respalda, aplica los pasos pendientes y lo reescribe de forma atómica. Así las
+lecturas del día a día (data_service, subscription_service) no revisan formatos
+antiguos en cada llamada.
+
+Para agregar un cambio de formato: escribir la función que transforma el JSON
+crudo y sumarla al final de la lista del archivo. Nunca reordenar ni quitar pasos.
+"""
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from src.services import data_service, subscription_service
+
+SCHEMA_VERSION_FILE = "schema_version.json"
+
+Migration = Tuple[str, Callable[[Any], Any]]  # (descripción, función sobre el JSON crudo)
+
+
+# --- user_data.json ---
+
+def _goals_by_subject(data: Dict[str, Any]) -> Dict[str, Any]:
+    for user_data in data.values():
+        if isinstance(user_data.get("study_goal"), int):
+            old_goal = user_data.pop("study_goal")
+            user_data.setdefault("goals", {}).setdefault("General", old_goal)
+    return data
+
+def _detailed_sessions(data: Dict[str, Any]) -> Dict[str, Any]:
+    for user_data in data.values():
+        if "study_sessions" in user_data:
+            user_data["sessions"] = [
+                {"date": s, "subject": "General"} if isinstance(s, str) else s
+                for s in user_data.pop("study_sessions")
+            ]
+    return data
+
+
+# --- chat_ids.json ---
+
+def _subscriptions_as_dict(data: Any) -> Dict[str, Any]:
+    if isinstance(data, list):
+        return {str(uid): {"time": subscription_service.DEFAULT_TIME} for uid in data}
+    return data
+
+
+MIGRATIONS: Dict[str, List[Migration]] = {
+    "user_data": [
+        ("Meta única (study_goal) -> metas por materia", _goals_by_subject),
+        ("Sesiones como fechas (study_sessions) -> {date, subject}", _detailed_sessions),
+    ],
+    "chat_ids": [
+        ("Lista de chat_ids -> {chat_id: preferencias}", _subscriptions_as_dict),
+    ],
+}
+
+def _data_files() -> Dict[str, str]:
+    # Se leen al momento: los módulos permiten cambiar la ruta (tests, benchmarks, CLI)
+    return {"user_data": data_service.DATA_FILE, "chat_ids": subscription_service.CHAT_IDS_FILE}
+
+def latest_version(store: str) -> int:
+    return len(MIGRATIONS[store])
+
+def _load_versions() -> Dict[str, int]:
+    if not os.path.exists(SCHEMA_VERSION_FILE):
+        return {}
+    with open(SCHEMA_VERSION_FILE, "r") as f:
+        return json.load(f)
+
+def _write_json(path: str, data: Any):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+def run_migrations() -> Dict[str, int]:
+    """
+    Lleva cada archivo de datos a su última versión. Devuelve {archivo: pasos aplicados}.
+    Un archivo que aún no existe queda registrado directamente en la última versión.
+    """
+    versions = _load_versions()
+    applied: Dict[str, int] = {}
+    changed = False
+    for store, path in _data_files().items():
+        current = versions.get(store, 0)
+        target = latest_version(store)
+        if current >= target:
+            continue
+        if os.path.exists(path):
+            backup = f"{path}.bak-v{current}-{time.strftime('%Y%m%d%H%M%S')}"
+            shutil.copy2(path, backup)
+            with open(path, "r") as f:
+                data = json.load(f)
+            for description, step in MIGRATIONS[store][current:target]:
+                logging.info(f"Migrando {path}: {description}")
+                data = step(data)
+            _write_json(path, data)
+            applied[path] = target - current
+            logging.info(f"{path} migrado de v{current} a v{target} (respaldo en {backup})")
+        versions[store] = target
+        changed = True
+    if changed:
+        _write_json(SCHEMA_VERSION_FILE, versions)
+    return applied
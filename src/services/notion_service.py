@@ -1,9 +1,38 @@
 import os
+import time
 from datetime import date
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
 from notion_client import Client
 import logging
 
+from src.models import Exam, parse_date
+
+NOTION_API_URL = "https://api.notion.com/v1"
+NOTION_VERSION = "2022-06-28"
+
+# Caché de decodificadores compilados: {database_id: _PageDecoder}
+# El esquema de la base casi nunca cambia, así que lo pedimos una sola vez por proceso.
+_DECODER_CACHE: Dict[str, "_PageDecoder"] = {}
+# Si el esquema no se pudo leer, se usa el decodificador dinámico (también en caché)
+# y se vuelve a pedir el esquema recién pasado este tiempo: {database_id: momento}
+SCHEMA_RETRY_SECONDS = int(os.getenv("NOTION_SCHEMA_RETRY", "300"))
+_SCHEMA_RETRY_AT: Dict[str, float] = {}
+
+
+class NotionError(Exception):
+    """Error de la API de Notion. `retry_after`: segundos que pidió esperar (429), si los indicó."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _retry_after(response) -> Optional[float]:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
 class NotionClient:
     def __init__(self):
         # Cargar y limpiar tokens (eliminar espacios en blanco por si acaso)
@@ -31,11 +60,11 @@ class NotionClient:
         self.prop_subject = "Ramo"
         self.prop_content = "Contenido" 
 
-    def get_upcoming_exams(self, subject_filter: Optional[str] = None) -> List[Dict[str, Any]]:
+    def get_upcoming_exams(self, subject_filter: Optional[str] = None) -> List[Exam]:
         """
         Obtiene exámenes desde Notion con fecha HOY o FUTURA.
         Opcional: filtra por materia (coincidencia parcial sin distinción mayúsculas/minúsculas).
-        Devuelve lista de dicts: [{'titulo': '...', 'fecha': 'YYYY-MM-DD', 'materia': '...', 'contenido': '...'}]
+        Devuelve lista de Exam (titulo, fecha como date, materia, contenido, url).
         """
         today = date.today().isoformat()
         
@@ -57,21 +86,16 @@ class NotionClient:
         # Usamos httpx directo para evitar problemas con la librería oficial en ciertos entornos
         import httpx
         
-        url = f"https://api.notion.com/v1/databases/{self.database_id}/query"
+        url = f"{NOTION_API_URL}/databases/{self.database_id}/query"
         
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Notion-Version": "2022-06-28",
-            "Content-Type": "application/json"
-        }
-        
-        logging.info(f"Consultando Notion URL: {url}")
+        logging.debug(f"Consultando Notion URL: {url}")
         
         try:
             with httpx.Client() as http_client:
+                decoder = self._get_decoder(http_client)
                 response = http_client.post(
                     url,
-                    headers=headers,
+                    headers=self._headers(),
                     json={
                         "filter": query_filter,
                         "sorts": sorts
@@ -82,26 +106,19 @@ class NotionClient:
                 data = response.json()
                 
             results = data.get("results", [])
-            logging.info(f"Notion encontró {len(results)} resultados.")
-            
-            if results:
-                # Debug: Imprimir propiedades disponibles del primer resultado para troubleshooting
-                first_props = results[0].get("properties", {}).keys()
-                logging.info(f"Propiedades disponibles en Notion DB: {list(first_props)}")
+            logging.debug(f"Notion encontró {len(results)} resultados.")
 
+            needle = subject_filter.lower() if subject_filter else None
             exams = []
             for page in results:
-                exam_data = self._parse_page(page)
-                if exam_data:
+                exam = decoder(page)
+                if exam:
                     # Filtrar por materia si se solicitó
-                    if subject_filter:
-                        materia = exam_data.get('materia', '').lower()
-                        if subject_filter.lower() not in materia:
-                            continue # Saltar si no coincide
-                            
-                    exams.append(exam_data)
+                    if needle and needle not in exam.materia.lower():
+                        continue # Saltar si no coincide
+                    exams.append(exam)
                 else:
-                    logging.warning(f"No se pudo analizar la página: {page.get('id')}")
+                    logging.warning(f"No se pudo analizar la página: {page.get('id')}", extra={"sample": "notion_parse"})
                     
             return exams
 
@@ -109,58 +126,215 @@ class NotionClient:
             error_details = e.response.text
             logging.error(f"Error HTTP Notion: {error_details}")
             # Lanzar excepción con detalles para que el bot la muestre
-            raise Exception(f"Error API Notion: {error_details}")
+            raise NotionError(f"Error API Notion: {error_details}", _retry_after(e.response))
         except Exception as e:
             logging.error(f"Error consultando Notion: {e}")
             raise e
 
-    def _parse_page(self, page: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """Convierte una página cruda de Notion a nuestro formato simplificado."""
-        properties = page.get("properties", {})
-        
-        # Extraer Fecha
-        date_prop = properties.get(self.prop_date, {})
-        date_val = None
-        if date_prop.get("type") == "date" and date_prop.get("date"):
-            date_val = date_prop["date"]["start"]
-        
-        if not date_val:
-            return None # Ignorar si no tiene fecha
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.token}",
+            "Notion-Version": NOTION_VERSION,
+            "Content-Type": "application/json"
+        }
 
-        # Extraer Título
-        title_prop = properties.get(self.prop_title, {})
-        title_val = "Sin Título"
-        if title_prop.get("type") == "title" and title_prop.get("title"):
-             # Unir fragmentos de texto
-            title_text = [t.get("plain_text", "") for t in title_prop.get("title", [])]
-            title_val = "".join(title_text)
-        elif title_prop.get("type") == "rich_text" and title_prop.get("rich_text"):
-             # Fallback if title is actually a rich_text field
-            title_text = [t.get("plain_text", "") for t in title_prop.get("rich_text", [])]
-            title_val = "".join(title_text)
-
-        # Extraer Materia (Select/Multi-select/Title)
-        subject_prop = properties.get(self.prop_subject, {})
-        subject_val = "Sin Materia"
-        if subject_prop.get("type") == "select" and subject_prop.get("select"):
-             subject_val = subject_prop["select"]["name"]
-        elif subject_prop.get("type") == "multi_select" and subject_prop.get("multi_select"):
-             subject_val = ", ".join([s["name"] for s in subject_prop["multi_select"]])
-        elif subject_prop.get("type") == "title" and subject_prop.get("title"):
-             subject_text = [t.get("plain_text", "") for t in subject_prop.get("title", [])]
-             subject_val = "".join(subject_text)
-
-        # Extraer Contenido (Rich Text)
-        content_prop = properties.get(self.prop_content, {})
-        content_val = ""
-        if content_prop.get("type") == "rich_text" and content_prop.get("rich_text"):
-            content_text = [t.get("plain_text", "") for t in content_prop.get("rich_text", [])]
-            content_val = "".join(content_text)
-        
+    def _get_decoder(self, http_client) -> "_PageDecoder":
+        """
+        Devuelve el decodificador compilado para esta base de datos.
+        La primera vez consulta el esquema (`databases/{id}`) y lo deja en caché.
+        Si el esquema no se puede leer, deja en caché un decodificador dinámico y no
+        vuelve a pedir el esquema hasta pasados SCHEMA_RETRY_SECONDS.
+        """
+        decoder = _DECODER_CACHE.get(self.database_id)
+        retry_at = _SCHEMA_RETRY_AT.get(self.database_id)
+        if decoder is not None and (retry_at is None or time.monotonic() < retry_at):
+            return decoder
+
+        try:
+            response = http_client.get(
+                f"{NOTION_API_URL}/databases/{self.database_id}",
+                headers=self._headers(),
+                timeout=10.0
+            )
+            response.raise_for_status()
+            schema = response.json().get("properties", {})
+        except Exception as e:
+            logging.warning(f"No se pudo leer el esquema de Notion, usando decodificador dinámico: {e}")
+            if decoder is None:
+                decoder = _compile_decoder(None, self._prop_names())
+                _DECODER_CACHE[self.database_id] = decoder
+            _SCHEMA_RETRY_AT[self.database_id] = time.monotonic() + SCHEMA_RETRY_SECONDS
+            return decoder
+
+        logging.info(f"Propiedades disponibles en Notion DB: {list(schema.keys())}")
+        decoder = _compile_decoder(schema, self._prop_names(), self._on_schema_mismatch)
+        _DECODER_CACHE[self.database_id] = decoder
+        _SCHEMA_RETRY_AT.pop(self.database_id, None)
+        return decoder
+
+    def _prop_names(self) -> Dict[str, str]:
         return {
-            "titulo": title_val,
-            "fecha": date_val,
-            "materia": subject_val,
-            "contenido": content_val,
-            "url": page.get("url", "")
+            "date": self.prop_date,
+            "title": self.prop_title,
+            "subject": self.prop_subject,
+            "content": self.prop_content,
         }
+
+    def _on_schema_mismatch(self, name: str, expected: Optional[str], actual: str):
+        """Una página no calza con el esquema compilado: se vuelve a pedir en la próxima consulta."""
+        if _DECODER_CACHE.pop(self.database_id, None) is not None:
+            logging.warning(f"La propiedad '{name}' cambió de tipo en Notion ({expected} -> {actual}); "
+                            f"se vuelve a leer el esquema.")
+
+    def invalidate_schema(self):
+        """Olvida el esquema compilado (usar si cambian las columnas en Notion)."""
+        _DECODER_CACHE.pop(self.database_id, None)
+        _SCHEMA_RETRY_AT.pop(self.database_id, None)
+
+
+# --- Decodificador compilado de páginas ---
+# Cada extractor conoce de antemano el tipo de su propiedad, así que no se
+# revisa `type` página por página.
+
+Extractor = Callable[[Dict[str, Any]], str]
+
+def _join_plain_text(fragments) -> str:
+    # Caso común: un solo fragmento, sin construir lista intermedia
+    if len(fragments) == 1:
+        return fragments[0].get("plain_text", "")
+    return "".join([t.get("plain_text", "") for t in fragments])
+
+def _text_extractor(name: str, prop_type: Optional[str], schema_type: Optional[str] = None,
+                    accepted=(), on_mismatch: Optional[Callable[[str, Optional[str], str], None]] = None) -> Extractor:
+    """
+    Crea un extractor de texto para una propiedad de tipo conocido.
+    Si una página trae la propiedad con otro tipo que `schema_type` (se cambió en
+    Notion), avisa a `on_mismatch` y la lee según su tipo real, como el parser dinámico.
+    """
+    readers = {t: _prop_reader(t) for t in accepted}
+
+    def fallback(props):
+        # Solo se llega aquí si falta el valor: vacío, o la propiedad cambió de tipo
+        prop = props.get(name)
+        actual = prop.get("type") if isinstance(prop, dict) else None
+        if actual is None or actual == schema_type:
+            return ""
+        if on_mismatch:
+            on_mismatch(name, schema_type, actual)
+        read = readers.get(actual)
+        return read(prop) if read else ""
+
+    if prop_type in ("title", "rich_text"):
+        def extract(props):
+            try:
+                fragments = props[name][prop_type]
+            except (KeyError, TypeError):
+                return fallback(props)
+            return _join_plain_text(fragments) if fragments else ""
+    elif prop_type == "select":
+        def extract(props):
+            try:
+                return props[name]["select"]["name"]
+            except (KeyError, TypeError):
+                return fallback(props)
+    elif prop_type == "multi_select":
+        def extract(props):
+            try:
+                options = props[name]["multi_select"]
+            except (KeyError, TypeError):
+                return fallback(props)
+            return ", ".join([s["name"] for s in options]) if options else ""
+    elif prop_type == "date":
+        def extract(props):
+            try:
+                return props[name]["date"]["start"]
+            except (KeyError, TypeError):
+                return fallback(props)
+    else:
+        extract = fallback
+    return extract
+
+def _prop_reader(prop_type: str) -> Callable[[Dict[str, Any]], str]:
+    """Lee el valor de una propiedad ya obtenida de la página (para el decodificador dinámico)."""
+    if prop_type in ("title", "rich_text"):
+        def read(prop):
+            fragments = prop.get(prop_type)
+            return _join_plain_text(fragments) if fragments else ""
+    elif prop_type == "select":
+        def read(prop):
+            option = prop.get("select")
+            return option["name"] if option else ""
+    elif prop_type == "multi_select":
+        def read(prop):
+            options = prop.get("multi_select")
+            return ", ".join([s["name"] for s in options]) if options else ""
+    else:
+        def read(prop):
+            value = prop.get("date")
+            return value["start"] if value else ""
+    return read
+
+class _PageDecoder:
+    """Convierte páginas crudas de Notion en Exam usando extractores fijos."""
+    __slots__ = ("_date", "_title", "_subject", "_content")
+
+    def __init__(self, date_ex: Extractor, title_ex: Extractor, subject_ex: Extractor, content_ex: Extractor):
+        self._date = date_ex
+        self._title = title_ex
+        self._subject = subject_ex
+        self._content = content_ex
+
+    def __call__(self, page: Dict[str, Any]) -> Optional[Exam]:
+        props = page.get("properties", {})
+        date_val = self._date(props)
+        if not date_val:
+            return None # Ignorar si no tiene fecha
+        try:
+            fecha = parse_date(date_val)
+        except ValueError:
+            return None
+        return Exam(
+            self._title(props) or "Sin Título",
+            fecha,
+            self._subject(props) or "Sin Materia",
+            self._content(props),
+            page.get("url", "")
+        )
+
+def _compile_decoder(schema: Optional[Dict[str, Any]], names: Dict[str, str],
+                     on_mismatch: Optional[Callable[[str, Optional[str], str], None]] = None) -> _PageDecoder:
+    """
+    Compila un decodificador a partir del esquema de la base (`properties` de `databases/{id}`).
+    Si `schema` es None, los extractores detectan el tipo en cada página.
+    `on_mismatch(propiedad, tipo del esquema, tipo en la página)` se llama si una página
+    no calza con el esquema compilado (para volver a pedirlo).
+    Tipos aceptados (igual que antes): Fecha=date, Título=title/rich_text,
+    Materia=select/multi_select/title, Contenido=rich_text.
+    """
+    accepted = {
+        "date": ("date",),
+        "title": ("title", "rich_text"),
+        "subject": ("select", "multi_select", "title"),
+        "content": ("rich_text",),
+    }
+
+    def build(key: str) -> Extractor:
+        name = names[key]
+        if schema is None:
+            # Esquema desconocido: detectar el tipo en cada página (comportamiento original)
+            readers = {t: _prop_reader(t) for t in accepted[key]}
+            def extract(props):
+                prop = props.get(name)
+                if not prop:
+                    return ""
+                read = readers.get(prop.get("type"))
+                return read(prop) if read else ""
+            return extract
+
+        prop_type = schema.get(name, {}).get("type")
+        if prop_type not in accepted[key] and name in schema:
+            logging.warning(f"La propiedad '{name}' es de tipo '{prop_type}', no soportado para '{key}'.")
+        return _text_extractor(name, prop_type if prop_type in accepted[key] else None,
+                               prop_type, accepted[key], on_mismatch)
+
+    return _PageDecoder(build("date"), build("title"), build("subject"), build("content"))
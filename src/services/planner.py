@@ -0,0 +1,105 @@
+"""
+Planificador de estudio para varios exámenes a la vez (Plan Global).
+
+Reparte sesiones diarias entre todos los exámenes próximos:
+- Cada examen necesita `meta semanal × semanas restantes` sesiones (meta de /meta
+  para su materia, o DEFAULT_WEEKLY_SESSIONS si no hay).
+- Cada día hay una capacidad máxima de sesiones (PLAN_DAILY_CAPACITY) y a lo más
+  una sesión por examen.
+- El orden de cada día sale de una cola de prioridad por urgencia: sesiones que
+  faltan / días que quedan, ponderado por la meta. Así los exámenes cercanos y
+  los que se solapan se reparten antes de que se acumulen.
+
+Los planes quedan en caché hasta que cambian los exámenes, las metas o el día.
+"""
+import heapq
+import os
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from src.models import Exam
+from src.utils.subjects import exam_subjects, normalize_subject
+
+PLAN_DAILY_CAPACITY = int(os.getenv("PLAN_DAILY_CAPACITY", "3"))
+DEFAULT_WEEKLY_SESSIONS = 3
+MAX_HORIZON_DAYS = 180
+PLAN_CACHE_SIZE = 256
+
+
+class StudyPlan:
+    """Resultado del planificador: sesiones por día y lo que no alcanzó a cubrirse."""
+    __slots__ = ("exams", "days", "assigned", "needed")
+
+    def __init__(self, exams: List[Exam], days: List[Tuple[date, List[int]]], assigned: List[int], needed: List[int]):
+        self.exams = exams
+        self.days = days          # [(día, [índice de examen, ...]), ...] solo días con sesiones
+        self.assigned = assigned  # sesiones asignadas por examen
+        self.needed = needed      # sesiones pedidas por examen
+
+    def shortfall(self, i: int) -> int:
+        return self.needed[i] - self.assigned[i]
+
+
+def _weekly_goal(exam: Exam, goals: Dict[str, int]) -> int:
+    """Meta semanal para la materia del examen (la mayor si es multi-materia)."""
+    values = [goals[s] for s in exam_subjects(exam.materia) if goals.get(s)]
+    return max(values) if values else DEFAULT_WEEKLY_SESSIONS
+
+def build_plan(exams: List[Exam], goals: Dict[str, int], today: date, capacity: int = PLAN_DAILY_CAPACITY) -> StudyPlan:
+    """
+    Asigna sesiones diarias (desde hoy hasta el día anterior a cada examen).
+    Los exámenes de hoy quedan en el resumen, sin sesiones que asignar.
+    """
+    goals = {normalize_subject(k): v for k, v in goals.items()}
+    exams = sorted((e for e in exams if e.fecha >= today), key=lambda e: e.fecha)
+
+    days_left = [min(e.days_left(today), MAX_HORIZON_DAYS) for e in exams]
+    weights = [_weekly_goal(e, goals) for e in exams]
+    needed = [max(1, min(d, -(-d * w // 7))) if d else 0 for d, w in zip(days_left, weights)]
+    remaining = list(needed)
+    assigned = [0] * len(exams)
+
+    plan_days: List[Tuple[date, List[int]]] = []
+    horizon = max(days_left, default=0)
+    first_open = 0  # exámenes antes de este índice ya pasaron
+    for offset in range(horizon):
+        while first_open < len(exams) and days_left[first_open] <= offset:
+            first_open += 1
+
+        # Prioridad: (sesiones que faltan / días disponibles) × meta. heapq es min-heap.
+        heap = []
+        for i in range(first_open, len(exams)):
+            if remaining[i] > 0:
+                available = days_left[i] - offset
+                heapq.heappush(heap, (-remaining[i] * weights[i] / available, days_left[i], i))
+
+        chosen = []
+        while heap and len(chosen) < capacity:
+            _, _, i = heapq.heappop(heap)
+            chosen.append(i)
+            remaining[i] -= 1
+            assigned[i] += 1
+        if chosen:
+            plan_days.append((today + timedelta(days=offset), sorted(chosen)))
+
+    return StudyPlan(exams, plan_days, assigned, needed)
+
+
+# Caché LRU: (versión de exámenes, día, metas, capacidad) -> StudyPlan
+_plan_cache: "OrderedDict[tuple, StudyPlan]" = OrderedDict()
+
+def get_plan(exams: List[Exam], exams_version: int, goals: Dict[str, int], today: Optional[date] = None,
+             capacity: int = PLAN_DAILY_CAPACITY) -> StudyPlan:
+    """Plan en caché; se recalcula solo si cambian los exámenes, las metas, el día o la capacidad."""
+    today = today or date.today()
+    key = (exams_version, today, tuple(sorted(goals.items())), capacity)
+    plan = _plan_cache.get(key)
+    if plan is not None:
+        _plan_cache.move_to_end(key)
+        return plan
+    plan = build_plan(exams, goals, today, capacity)
+    _plan_cache[key] = plan
+    if len(_plan_cache) > PLAN_CACHE_SIZE:
+        _plan_cache.popitem(last=False)
+    return plan
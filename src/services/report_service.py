@@ -0,0 +1,239 @@
+"""
+Reporte Semanal escalonado.
+
+En vez de armar y enviar todos los reportes el domingo a las 20:00 en el mismo
+minuto, el trabajo se reparte:
+1. Durante la tarde del domingo se arman los reportes por lotes y se guardan listos.
+2. Cada usuario tiene un horario de entrega: su hora preferida ("report_time" en
+   sus preferencias) o un desfase fijo dentro de la ventana de entrega, derivado
+   de su chat_id (jitter estable).
+3. Cada minuto se envían los reportes cuyo horario ya llegó, en orden, avanzando
+   un cursor que se guarda en disco para retomar si el bot se reinicia. Un envío
+   fallido vuelve a la cola REPORT_RETRY_MINUTES después, hasta REPORT_MAX_ATTEMPTS
+   intentos.
+Los grupos suscritos no reciben reporte: las sesiones se guardan por persona y
+la actividad del grupo está en /ranking.
+"""
+import json
+import logging
+import os
+import zlib
+from bisect import bisect_right
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.models import Session
+from src.services.data_service import get_weekly_progress, get_current_streak, add_session_listener, add_history_listener
+
+REPORTS_FILE = "weekly_reports.json"
+
+# Inicio de la entrega y largo de la ventana (minutos). Configurables por entorno.
+REPORT_START = os.getenv("WEEKLY_REPORT_START", "20:00")
+REPORT_WINDOW_MINUTES = int(os.getenv("WEEKLY_REPORT_WINDOW_MIN", "120"))
+# Máximo de envíos por minuto, para que la tasa de salida no crezca con los usuarios
+REPORT_MAX_PER_MINUTE = int(os.getenv("WEEKLY_REPORT_MAX_PER_MIN", "300"))
+# Reintentos de un envío fallido: minutos de espera e intentos totales
+REPORT_RETRY_MINUTES = int(os.getenv("WEEKLY_REPORT_RETRY_MIN", "5"))
+REPORT_MAX_ATTEMPTS = int(os.getenv("WEEKLY_REPORT_MAX_ATTEMPTS", "3"))
+
+LAST_MINUTE_OF_DAY = 23 * 60 + 59
+
+# Estado de la semana en curso (se carga desde REPORTS_FILE la primera vez):
+# {"week": "2026-W42", "queue": [[minuto, chat_id], ...], "cursor": 0, "bodies": {chat_id: texto},
+#  "attempts": {chat_id: envíos fallidos}, "in_flight": [chat_id ya entregado a enviar, sin confirmar]}
+_state: Optional[Dict[str, Any]] = None
+
+def _minutes(hhmm: str) -> int:
+    h, m = hhmm.split(":")
+    return int(h) * 60 + int(m)
+
+def _week_key(day: date) -> str:
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+def delivery_minute(chat_id: str, prefs: Dict[str, Any]) -> int:
+    """Minuto del domingo (0-1439) en que se entrega el reporte de este usuario."""
+    preferred = prefs.get("report_time")
+    if preferred:
+        try:
+            return _minutes(preferred)
+        except ValueError:
+            pass
+    jitter = zlib.crc32(str(chat_id).encode()) % max(REPORT_WINDOW_MINUTES, 1)
+    return min(_minutes(REPORT_START) + jitter, LAST_MINUTE_OF_DAY)
+
+def _load_state() -> Dict[str, Any]:
+    global _state
+    if _state is None:
+        _state = {"week": None, "queue": [], "cursor": 0, "bodies": {}}
+        if os.path.exists(REPORTS_FILE):
+            try:
+                with open(REPORTS_FILE, "r") as f:
+                    _state = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                logging.error(f"No se pudo leer {REPORTS_FILE}: {e}")
+        _state.setdefault("attempts", {})
+        _state.setdefault("in_flight", [])
+    return _state
+
+def _save_state():
+    with open(REPORTS_FILE, "w") as f:
+        json.dump(_state, f)
+
+def _is_group(chat_id: str) -> bool:
+    """Los chats de grupo tienen id negativo."""
+    return str(chat_id).startswith("-")
+
+def _ensure_week(subscriptions: Dict[str, Any], today: date) -> Dict[str, Any]:
+    """Prepara la cola de la semana y agrega suscriptores nuevos sin reordenar lo ya enviado."""
+    subscriptions = {cid: prefs for cid, prefs in subscriptions.items() if not _is_group(cid)}
+    state = _load_state()
+    week = _week_key(today)
+    if state["week"] != week:
+        queue = sorted([delivery_minute(cid, prefs), cid] for cid, prefs in subscriptions.items())
+        state.update({"week": week, "queue": queue, "cursor": 0, "bodies": {}, "attempts": {}, "in_flight": []})
+        _save_state()
+        return state
+
+    # Una cola armada por una versión anterior puede traer grupos pendientes
+    pending = state["queue"][state["cursor"]:]
+    if any(_is_group(cid) for _, cid in pending):
+        state["queue"][state["cursor"]:] = [entry for entry in pending if not _is_group(entry[1])]
+    queued = {cid for _, cid in state["queue"]}
+    for cid, prefs in subscriptions.items():
+        if cid in queued:
+            continue
+        entry = [delivery_minute(cid, prefs), cid]
+        pos = max(bisect_right(state["queue"], entry), state["cursor"])
+        state["queue"].insert(pos, entry)
+    return state
+
+def build_report(chat_id: int) -> str:
+    """Arma el texto del reporte semanal de un usuario."""
+    progress = get_weekly_progress(chat_id)
+    streak = get_current_streak(chat_id)
+
+    # Enviaremos resumen siempre para mantener engagement.
+    msg = "📉 **Resumen de tu Semana** (Automático)\n\n"
+
+    if streak > 0:
+        msg += f"🔥 **Racha Activa**: {streak} días\n"
+    else:
+        msg += f"❄️ **Racha**: 0 días (¡Empieza mañana!)\n"
+
+    total = 0
+    details = ""
+    for subj, data in progress.items():
+        c = data['current']
+        if c > 0:
+            details += f"- {subj}: {c} sesiones\n"
+            total += c
+
+    msg += f"📚 **Total Sesiones**: {total}\n\n"
+
+    if total > 0:
+        msg += "Detalle:\n" + details
+        msg += "\n🎉 ¡Buen esfuerzo! Descansa y prepárate para la próxima. 💪"
+    else:
+        msg += "❌ No registraste actividad esta semana.\n¡La próxima será mejor! 👊"
+    return msg
+
+def build_reports_batch(subscriptions: Dict[str, Any], batch_size: int, today: Optional[date] = None) -> int:
+    """
+    Arma hasta `batch_size` reportes pendientes (en orden de entrega) y los guarda.
+    Devuelve cuántos armó.
+    """
+    state = _ensure_week(subscriptions, today or date.today())
+    bodies = state["bodies"]
+    built = 0
+    for _, cid in state["queue"][state["cursor"]:]:
+        if built >= batch_size:
+            break
+        if cid in bodies:
+            continue
+        try:
+            bodies[cid] = build_report(int(cid))
+            built += 1
+        except Exception as e:
+            logging.error(f"Error armando reporte semanal: {e}", extra={"chat_id": cid, "sample": "report_build_error"})
+    if built:
+        _save_state()
+    return built
+
+def due_reports(subscriptions: Dict[str, Any], now: datetime) -> List[Tuple[str, str]]:
+    """
+    Reportes cuyo horario ya llegó, desde el cursor (máx. REPORT_MAX_PER_MINUTE).
+    Si alguno no alcanzó a armarse (o se invalidó), se arma ahora.
+    El cursor avanza aquí, antes de enviar: lo que se agregue a la cola mientras se
+    envía queda después de este lote. Los entregados quedan en "in_flight" hasta
+    `mark_delivered`; si el bot se reinicia a mitad de envío, se vuelven a entregar.
+    """
+    state = _ensure_week(subscriptions, now.date())
+    current = now.hour * 60 + now.minute
+    chat_ids = list(state["in_flight"])
+    start = state["cursor"]
+    for minute, cid in state["queue"][start:start + REPORT_MAX_PER_MINUTE - len(chat_ids)]:
+        if minute > current:
+            break
+        chat_ids.append(cid)
+        state["cursor"] += 1
+    if not chat_ids:
+        return []
+    state["in_flight"] = chat_ids
+    _save_state()
+
+    due = []
+    for cid in chat_ids:
+        body = state["bodies"].get(cid)
+        if body is None:
+            body = build_report(int(cid))
+        due.append((cid, body))
+    return due
+
+def mark_delivered(chat_ids: Iterable[str], failed: Iterable[str] = (), now: Optional[datetime] = None):
+    """
+    Confirma los reportes de `chat_ids` que entregó `due_reports`. Los de `failed`
+    vuelven a la cola REPORT_RETRY_MINUTES más tarde (hasta REPORT_MAX_ATTEMPTS
+    intentos); el resto libera su texto.
+    """
+    state = _load_state()
+    chat_ids = list(chat_ids)
+    failed = set(failed)
+    done = set(chat_ids)
+    state["in_flight"] = [cid for cid in state["in_flight"] if cid not in done]
+    now = now or datetime.now()
+    retry_minute = min(now.hour * 60 + now.minute + REPORT_RETRY_MINUTES, LAST_MINUTE_OF_DAY)
+    for cid in chat_ids:
+        if cid not in failed:
+            state["bodies"].pop(cid, None)
+            state["attempts"].pop(cid, None)
+            continue
+        attempts = state["attempts"].get(cid, 0) + 1
+        if attempts >= REPORT_MAX_ATTEMPTS:
+            logging.error(f"Reporte semanal descartado tras {attempts} intentos", extra={"chat_id": cid})
+            state["bodies"].pop(cid, None)
+            state["attempts"].pop(cid, None)
+            continue
+        state["attempts"][cid] = attempts
+        entry = [retry_minute, cid]
+        state["queue"].insert(max(bisect_right(state["queue"], entry), state["cursor"]), entry)
+    _save_state()
+
+def _invalidate_report(chat_id: int):
+    """
+    Descarta el reporte ya armado de ese usuario. Se guarda en disco: si no, tras un
+    reinicio se enviaría el texto viejo.
+    """
+    state = _load_state()
+    if state["bodies"].pop(str(chat_id), None) is not None:
+        _save_state()
+
+def _on_session_logged(chat_id: int, session: Session):
+    """Una sesión nueva deja obsoleto el reporte ya armado de ese usuario."""
+    _invalidate_report(chat_id)
+
+def _on_history_imported(chat_id: int):
+    _invalidate_report(chat_id)
+
+add_session_listener(_on_session_logged)
+add_history_listener(_on_history_imported)
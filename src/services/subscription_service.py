@@ -0,0 +1,137 @@
+"""
+Suscripciones y preferencias de alertas por usuario (chat_ids.json).
+
+Esquema: {"chat_id": {"time": "08:00",
+                      "report_time": "21:00",       (opcional, reporte semanal)
+                      "subjects": ["Cálculo", ...], (opcional, ausente = todas)
+                      "days": 5}}                   (opcional, días de anticipación)
+
+Además mantiene un índice en memoria (SubscriptionIndex) para el chequeo de cada
+minuto: usuarios por hora, índice invertido materia -> suscriptores y la
+"firma" de preferencias de cada usuario para renderizar cada resumen una sola vez.
+"""
+import json
+import os
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from src.utils.subjects import normalize_subject
+
+# Archivo para almacenar IDs de chat y configuraciones
+CHAT_IDS_FILE = "chat_ids.json"
+
+DEFAULT_TIME = "08:00"
+DEFAULT_ALERT_DAYS = 5
+MAX_ALERT_DAYS = 14
+
+# Copia en memoria del archivo e índice derivado, válidos mientras no cambie su mtime
+_cache: Dict[str, Any] = {"mtime": None, "data": None, "index": None}
+
+# Firma de preferencias de alerta: (materias normalizadas o None = todas, días)
+AlertSignature = Tuple[Optional[FrozenSet[str]], int]
+
+def get_subscriptions():
+    """Devuelve un diccionario de suscripciones: {chat_id: {'time': 'HH:MM', ...}}"""
+    try:
+        mtime = os.path.getmtime(CHAT_IDS_FILE)
+    except OSError:
+        return {}
+    if _cache["mtime"] == mtime:
+        return _cache["data"]
+    try:
+        with open(CHAT_IDS_FILE, "r") as f:
+            data = json.load(f)
+    except (json.JSONDecodeError, IOError):
+        return {}
+    _cache.update({"mtime": mtime, "data": data, "index": None})
+    return data
+
+def save_subscriptions(data):
+    """Guarda el diccionario de suscripciones en el archivo JSON."""
+    with open(CHAT_IDS_FILE, "w") as f:
+        json.dump(data, f, indent=2)
+    _cache.update({"mtime": os.path.getmtime(CHAT_IDS_FILE), "data": data, "index": None})
+
+def register_user(chat_id):
+    """Registra un nuevo usuario con la hora por defecto (08:00)."""
+    data = get_subscriptions()
+    str_id = str(chat_id)
+    if str_id not in data:
+        data[str_id] = {"time": DEFAULT_TIME}
+        save_subscriptions(data)
+
+def _update_prefs(chat_id, **changes):
+    """Aplica cambios a las preferencias de un usuario (None = borrar la clave)."""
+    data = get_subscriptions()
+    prefs = data.setdefault(str(chat_id), {"time": DEFAULT_TIME})
+    for key, value in changes.items():
+        if value is None:
+            prefs.pop(key, None)
+        else:
+            prefs[key] = value
+    save_subscriptions(data)
+
+def set_reminder_time(chat_id, time_str):
+    """Actualiza la hora de recordatorio para un usuario específico."""
+    _update_prefs(chat_id, time=time_str)
+
+def set_report_time(chat_id, time_str):
+    """Fija (o borra, con None) la hora preferida del reporte semanal del domingo."""
+    _update_prefs(chat_id, report_time=time_str)
+
+def set_alert_subjects(chat_id, subjects: Optional[List[str]]):
+    """Limita las alertas a ciertas materias (None = todas)."""
+    _update_prefs(chat_id, subjects=subjects or None)
+
+def set_alert_days(chat_id, days: int):
+    """Días de anticipación de las alertas (1..MAX_ALERT_DAYS)."""
+    _update_prefs(chat_id, days=max(1, min(days, MAX_ALERT_DAYS)))
+
+def alert_signature(prefs: Dict[str, Any]) -> AlertSignature:
+    subjects = prefs.get("subjects")
+    normalized = frozenset(normalize_subject(s) for s in subjects) if subjects else None
+    return normalized, int(prefs.get("days", DEFAULT_ALERT_DAYS))
+
+
+class SubscriptionIndex:
+    """Índices de solo lectura sobre las suscripciones, reconstruidos al cambiar el archivo."""
+
+    def __init__(self, subscriptions: Dict[str, Dict[str, Any]]):
+        self.by_time: Dict[str, List[str]] = {}
+        self.by_subject: Dict[str, Set[str]] = {}
+        self.all_subjects: Set[str] = set()
+        self.signatures: Dict[str, AlertSignature] = {}
+
+        for chat_id, prefs in subscriptions.items():
+            self.by_time.setdefault(prefs.get("time", DEFAULT_TIME), []).append(chat_id)
+            signature = alert_signature(prefs)
+            self.signatures[chat_id] = signature
+            if signature[0] is None:
+                self.all_subjects.add(chat_id)
+            else:
+                for subj in signature[0]:
+                    self.by_subject.setdefault(subj, set()).add(chat_id)
+
+    def due_at(self, hhmm: str) -> List[str]:
+        return self.by_time.get(hhmm, [])
+
+    def interested_in(self, subjects) -> Set[str]:
+        """Usuarios que deben recibir alertas de alguna de estas materias (normalizadas)."""
+        users = set(self.all_subjects)
+        for subj in subjects:
+            users |= self.by_subject.get(subj, set())
+        return users
+
+    def group_by_signature(self, chat_ids) -> Dict[AlertSignature, List[str]]:
+        groups: Dict[AlertSignature, List[str]] = {}
+        for chat_id in chat_ids:
+            groups.setdefault(self.signatures[chat_id], []).append(chat_id)
+        return groups
+
+def get_subscription_index() -> SubscriptionIndex:
+    subscriptions = get_subscriptions()
+    if _cache["index"] is None or _cache["data"] is not subscriptions:
+        index = SubscriptionIndex(subscriptions)
+        if _cache["data"] is subscriptions:
+            _cache["index"] = index
+        return index
+    return _cache["index"]
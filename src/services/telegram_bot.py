@@ -1,62 +1,31 @@
 import os
+import time
+import asyncio
+import tempfile
 import logging
+import functools
+from collections import OrderedDict
 from datetime import datetime, date, timedelta
 from telegram import Update
+from telegram.constants import ParseMode, ChatType
 from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler
-from src.services.notion_service import NotionClient
+from src.services.exam_cache import exam_cache
+from src.services.planner import get_plan
+from src.services.leaderboard_service import track_member, untrack_member, get_ranking
+from src.services.import_export import import_stream, export_to, format_for
+from src.services.inline_service import InlineIndex, InlineDebouncer, INLINE_CACHE_TIME, MAX_INLINE_RESULTS
 from src.utils.quotes import get_random_quote
-from src.services.data_service import set_study_goal, log_study_session, get_weekly_progress, get_current_streak
-
-# Configure logging if not already done in main
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+from src.utils.loop_watchdog import register_handler
+from src.utils.rate_limit import RateLimiter
+from src.utils import metrics
+from src.utils.formatting import (
+    PAGE_CALLBACK_PREFIX, PageCache, paginate, page_keyboard, escape_md, bold, italic, link
+)
+from src.services.data_service import set_study_goal, log_study_session, get_weekly_progress, get_current_streak, get_total_sessions, get_history_stats, get_goals, canonical_subject, suggest_subject, notify_history_changed
+from src.services.subscription_service import (
+    get_subscriptions, register_user, set_reminder_time, set_report_time,
+    set_alert_subjects, set_alert_days, DEFAULT_ALERT_DAYS, MAX_ALERT_DAYS
 )
-
-import json
-
-# Archivo para almacenar IDs de chat y configuraciones
-# Esquema: {"chat_id": {"time": "08:00"}}
-CHAT_IDS_FILE = "chat_ids.json"
-
-def get_subscriptions():
-    """Devuelve un diccionario de suscripciones: {chat_id: {'time': 'HH:MM'}}"""
-    if not os.path.exists(CHAT_IDS_FILE):
-        return {}
-    try:
-        with open(CHAT_IDS_FILE, "r") as f:
-            data = json.load(f)
-            # Migración: Si la data antigua era una lista [id1, id2], la convertimos a dict
-            if isinstance(data, list):
-                new_data = {str(uid): {"time": "08:00"} for uid in data}
-                save_subscriptions(new_data)
-                return new_data
-            return data
-    except (json.JSONDecodeError, IOError):
-        return {}
-
-def save_subscriptions(data):
-    """Guarda el diccionario de suscripciones en el archivo JSON."""
-    with open(CHAT_IDS_FILE, "w") as f:
-        json.dump(data, f, indent=2)
-
-def register_user(chat_id):
-    """Registra un nuevo usuario con la hora por defecto (08:00)."""
-    data = get_subscriptions()
-    str_id = str(chat_id)
-    if str_id not in data:
-        data[str_id] = {"time": "08:00"}
-        save_subscriptions(data)
-
-def set_reminder_time(chat_id, time_str):
-    """Actualiza la hora de recordatorio para un usuario específico."""
-    data = get_subscriptions()
-    str_id = str(chat_id)
-    if str_id not in data:
-        data[str_id] = {} # Debería estar registrado, pero por seguridad lo creamos
-    
-    data[str_id]["time"] = time_str
-    save_subscriptions(data)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manejador para el comando /start. Inicia la interacción."""
@@ -65,7 +34,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Guarda el Chat ID con la configuración por defecto
     register_user(chat_id)
-    logging.info(f"Nuevo usuario suscrito: {user} ({chat_id})")
+    logging.info(f"Nuevo usuario suscrito: {user}", extra={"chat_id": chat_id, "command": "start"})
 
     await update.message.reply_text(
         f"¡Hola {user}! 👋 Soy tu Bot Académico.\n\n"
@@ -85,9 +54,11 @@ async def proximos(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("🔎 Consultando Notion... dame un segundo.")
     
     try:
-        # Instanciamos el cliente para esta petición específica
-        client = NotionClient()
-        exams = client.get_upcoming_exams(subject_filter)
+        # Exámenes desde la caché; el filtro tolera tildes, mayúsculas y errores de tipeo
+        if subject_filter:
+            exams = await asyncio.to_thread(exam_cache.search, subject_filter)
+        else:
+            exams = await asyncio.to_thread(exam_cache.get_exams)
         
         if not exams:
             if subject_filter:
@@ -96,27 +67,16 @@ async def proximos(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await update.message.reply_text("¡Eres libre! No hay pruebas pronto. 🎉 Disfruta tu tiempo.")
             return
 
-        title_msg = f"📅 **Próximos para '{subject_filter}':**\n\n" if subject_filter else "📅 **Próximos Exámenes y Entregas:**\n\n"
-        message = title_msg
-        
-        for exam in exams:
-            title = exam.get('titulo', 'Sin título')
-            date_str = exam.get('fecha', 'Sin fecha')
-            subject = exam.get('materia', 'General')
-            content = exam.get('contenido', '')
-            
-            message += f"📚 *{subject}*\n"
-            message += f"📝 {title}\n"
-            if content:
-                message += f"ℹ️ _{content}_\n"
-            message += f"⏰ {date_str}\n"
-            if exam.get('url'):
-                message += f"🔗 [Ver en Notion]({exam.get('url')})\n"
-            message += "-------------------------\n"
-            
-        message += f"\n{get_random_quote()}"
-        
-        await update.message.reply_markdown(message)
+        title_msg = f"Próximos para '{subject_filter}':" if subject_filter else "Próximos Exámenes y Entregas:"
+        blocks = [_render_exam_block(exam) for exam in exams]
+        await send_paginated(
+            context.bot,
+            update.effective_chat.id,
+            blocks,
+            header=f"📅 {bold(title_msg)}\n\n",
+            footer=f"\n{escape_md(get_random_quote())}",
+            answer_key=_answer_key(update)
+        )
         
     except ValueError as ve:
         # Manejo de error si faltan variables de entorno
@@ -124,14 +84,32 @@ async def proximos(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logging.error(f"Error de configuración: {ve}")
     except Exception as e:
         await update.message.reply_text(f"❌ Hubo un error al intentar conectar con Notion: {e}")
-        logging.error(f"Error en /proximos: {e}")
+        logging.error(f"Error en /proximos: {e}", extra={"chat_id": update.effective_chat.id, "command": "proximos"})
 
 async def config(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Manejador para /config HH:MM. Cambia hora de notificación."""
+    """Manejador para /config HH:MM (recordatorio diario) o /config reporte HH:MM (reporte semanal)."""
     chat_id = update.effective_chat.id
     
     if not context.args:
-        await update.message.reply_text("⚠️ Uso: /config HH:MM (ej. /config 10:00)")
+        await update.message.reply_text(
+            "⚠️ Uso: /config HH:MM (ej. /config 10:00)\n"
+            "Reporte semanal del domingo: /config reporte HH:MM (o /config reporte auto)"
+        )
+        return
+    
+    # Hora preferida para el reporte semanal
+    if context.args[0].lower() == "reporte":
+        value = context.args[1] if len(context.args) > 1 else ""
+        if value.lower() == "auto":
+            set_report_time(chat_id, None)
+            await update.message.reply_text("✅ Tu reporte semanal llegará el domingo en la noche (horario automático).")
+            return
+        try:
+            normalized_time = datetime.strptime(value, "%H:%M").strftime("%H:%M")
+            set_report_time(chat_id, normalized_time)
+            await update.message.reply_text(f"✅ Tu reporte semanal llegará los domingos a las {normalized_time}.")
+        except ValueError:
+            await update.message.reply_text("❌ Formato inválido. Usa /config reporte HH:MM (24 horas). Ej: /config reporte 21:30")
         return
     
     time_str = context.args[0]
@@ -146,9 +124,44 @@ async def config(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except ValueError:
         await update.message.reply_text("❌ Formato inválido. Usa HH:MM (24 horas). Ej: 08:00 o 18:30")
 
+async def alertas(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Manejador para /alertas. Elige de qué materias y con cuántos días de anticipación avisar."""
+    chat_id = update.effective_chat.id
+    args = context.args or []
+    
+    if not args:
+        prefs = get_subscriptions().get(str(chat_id), {})
+        subjects = prefs.get("subjects")
+        days = prefs.get("days", DEFAULT_ALERT_DAYS)
+        current = ", ".join(subjects) if subjects else "todas"
+        await update.message.reply_text(
+            f"🔔 Tus alertas: materias {current}, con {days} días de anticipación.\n\n"
+            "Cambiar:\n"
+            "/alertas materias Cálculo, Física\n"
+            "/alertas todas\n"
+            f"/alertas dias 3 (1-{MAX_ALERT_DAYS})"
+        )
+        return
+    
+    option = args[0].lower()
+    if option == "todas":
+        set_alert_subjects(chat_id, None)
+        await update.message.reply_text("✅ Recibirás alertas de todas las materias.")
+    elif option == "materias" and len(args) > 1:
+        subjects = [s.strip() for s in " ".join(args[1:]).split(",") if s.strip()]
+        set_alert_subjects(chat_id, subjects)
+        await update.message.reply_text(f"✅ Solo te avisaré de: {', '.join(subjects)}.")
+    elif option in ("dias", "días") and len(args) > 1 and args[1].isdigit():
+        days = max(1, min(int(args[1]), MAX_ALERT_DAYS))
+        set_alert_days(chat_id, days)
+        await update.message.reply_text(f"✅ Te avisaré con {days} días de anticipación.")
+    else:
+        await update.message.reply_text(f"❌ Uso: /alertas materias A, B | /alertas todas | /alertas dias N (1-{MAX_ALERT_DAYS})")
+
 async def meta(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manejador para /meta. Fija objetivos de estudio semanales."""
-    chat_id = update.effective_chat.id
+    # Metas y sesiones son de la persona, también en grupos (ver estudie)
+    user_id = update.effective_user.id
     
     # Modo Manual/Legado: /meta [Materia] [Numero]
     if context.args:
@@ -156,10 +169,10 @@ async def meta(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if context.args[-1].isdigit():
                 goal = int(context.args[-1])
                 if len(context.args) > 1:
-                    subject = " ".join(context.args[:-1])
+                    subject = canonical_subject(user_id, " ".join(context.args[:-1]))
                 else:
                     subject = "General"
-                set_study_goal(chat_id, goal, subject)
+                set_study_goal(user_id, goal, subject)
                 await update.message.reply_text(f"🎯 ¡Meta fijada! **{subject}**: {goal} sesiones/semana.")
             else:
                 await update.message.reply_text("❌ El último argumento debe ser un número.")
@@ -170,12 +183,11 @@ async def meta(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Modo Interactivo
     await update.message.reply_text("⏳ Cargando materias...")
     try:
-        client = NotionClient()
-        exams = client.get_upcoming_exams()
+        exams = await asyncio.to_thread(exam_cache.get_exams)
         
         keyboard = []
         for exam in exams[:5]:
-            title = exam.get('titulo', 'Tarea')
+            title = exam.titulo
             cb_data = f"META_SUBJ:{title}"[:64]
             keyboard.append([InlineKeyboardButton(f"🎯 {title}", callback_data=cb_data)])
             
@@ -186,21 +198,24 @@ async def meta(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ Error Notion: {e}")
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, CallbackQueryHandler
+from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, CallbackQueryHandler, MessageHandler, InlineQueryHandler, filters
 
 # ... (omitted)
 
 async def estudie(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manejador para /estudie. Registra sesiones de estudio."""
-    chat_id = update.effective_chat.id
+    # Las sesiones son de la persona (en un chat privado su id coincide con el del chat)
+    user_id = update.effective_user.id
     
     # Si hay argumentos, usar registro directo (Modo Legado)
     if context.args:
-        subject = " ".join(context.args)
-        is_new = log_study_session(chat_id, subject)
+        subject = canonical_subject(user_id, " ".join(context.args))
+        # Antes de registrar: después la materia ya sería conocida
+        suggestion = suggest_subject(user_id, subject)
+        is_new = log_study_session(user_id, subject)
         
         if is_new:
-            progress_data = get_weekly_progress(chat_id)
+            progress_data = get_weekly_progress(user_id)
             p = progress_data.get(subject, {'current': 0, 'goal': 0, 'percentage': 0})
             current = p['current']
             goal = p['goal']
@@ -211,6 +226,8 @@ async def estudie(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 msg += f"🔥 Llevas {current}/{goal} ({percent}%)"
             else:
                 msg += f"🔥 Llevas {current} sesiones."
+            if suggestion:
+                msg += f"\n💡 ¿Quisiste decir **{suggestion}**? Usa `/estudie {suggestion}`."
             await update.message.reply_markdown(msg)
         else:
             await update.message.reply_text(f"😅 Ya registraste **{subject}** hoy.")
@@ -220,13 +237,12 @@ async def estudie(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("⏳ Buscando entregas pendientes...")
     
     try:
-        client = NotionClient()
-        exams = client.get_upcoming_exams()
+        exams = await asyncio.to_thread(exam_cache.get_exams)
         
         keyboard = []
         # Crear botones para los próximos 5 exámenes
         for exam in exams[:5]:
-            title = exam.get('titulo', 'Tarea')
+            title = exam.titulo
             # Callback data: "LOG:<Title>"
             # Truncamos título para evitar límite de 64 caracteres
             cb_data = f"LOG:{title}"[:64] 
@@ -242,6 +258,111 @@ async def estudie(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logging.error(f"Error buscando botones: {e}")
         await update.message.reply_text("❌ Error con Notion. Usa `/estudie [Materia]` manualmente.")
 
+# Listados paginados ya renderizados (para los botones anterior/siguiente)
+page_cache = PageCache()
+
+async def send_paginated(bot, chat_id, blocks, header="", footer="", answer_key=None):
+    """
+    Envía un listado en MarkdownV2 partido en páginas de <= 4096 caracteres.
+    Con `answer_key`, la primera página queda guardada para responder si el chat es limitado.
+    """
+    pages = paginate(blocks, header=header, footer=footer)
+    key = page_cache.put(pages) if len(pages) > 1 else ""
+    markup = page_keyboard(key, 0, len(pages))
+    await bot.send_message(
+        chat_id=chat_id,
+        text=pages[0],
+        parse_mode=ParseMode.MARKDOWN_V2,
+        reply_markup=markup,
+        disable_web_page_preview=True
+    )
+    if answer_key is not None:
+        _remember_answer(answer_key, pages[0], markup)
+
+def _render_exam_block(exam) -> str:
+    """Bloque MarkdownV2 de un examen para /proximos."""
+    block = f"📚 {bold(exam.materia)}\n"
+    block += f"📝 {escape_md(exam.titulo)}\n"
+    if exam.contenido:
+        block += f"ℹ️ {italic(exam.contenido)}\n"
+    block += f"⏰ {escape_md(exam.fecha.isoformat())}\n"
+    if exam.url:
+        block += f"🔗 {link('Ver en Notion', exam.url)}\n"
+    block += escape_md("-------------------------") + "\n"
+    return block
+
+WEEKDAY_NAMES = ("lun", "mar", "mié", "jue", "vie", "sáb", "dom")
+
+def _render_global_plan(plan) -> list:
+    """Bloques MarkdownV2 del Plan Global: resumen por examen y luego una semana por bloque."""
+    e = escape_md
+    summary = f"🎯 {bold('Sesiones por examen')}\n"
+    for i, exam in enumerate(plan.exams):
+        line = f"- {exam.titulo} ({exam.fecha.strftime('%d-%m')}): "
+        if plan.needed[i]:
+            line += f"{plan.assigned[i]}/{plan.needed[i]}"
+        else:
+            line += "¡Es hoy! 🍀"
+        if plan.shortfall(i) > 0:
+            line += " ⚠️"
+        summary += e(line) + "\n"
+    missing = [i for i in range(len(plan.exams)) if plan.shortfall(i) > 0]
+    if missing:
+        summary += "\n" + italic("⚠️ No alcanzan los días para cubrir tu meta en esos exámenes. "
+                                 "Considera subir la capacidad diaria o priorizar.") + "\n"
+    blocks = [summary + "\n"]
+
+    week_block, week_key = "", None
+    for day, indices in plan.days:
+        key = day.isocalendar()[:2]
+        if key != week_key:
+            if week_block:
+                blocks.append(week_block + "\n")
+            week_key = key
+            week_block = f"🗓 {bold('Semana del ' + day.strftime('%d-%m'))}\n"
+        names = ", ".join(plan.exams[i].titulo for i in indices)
+        week_block += e(f"{WEEKDAY_NAMES[day.weekday()]} {day.strftime('%d-%m')}: {names}") + "\n"
+    if week_block:
+        blocks.append(week_block + "\n")
+    return blocks
+
+def _render_plan_block(exam, today: date) -> str:
+    """Bloque MarkdownV2 con el plan sugerido para un examen."""
+    exam_date = exam.fecha
+    date_str = exam_date.isoformat()
+    days_until = exam.days_left(today)
+    start_week_2 = exam_date - timedelta(days=7)
+    e = escape_md
+    
+    block = f"🎓 {bold(exam.titulo)}\n🗓 {e(f'{date_str} (en {days_until} días)')}\n\n"
+    
+    if days_until > 14:
+        week_2 = start_week_2.strftime('%d-%m')
+        block += f"{bold('Semana 1')} {e(f'(hasta {week_2}):')} 📖 Teoría\n"
+        block += e("- Lee la bibliografía.\n- Haz mapas conceptuales.\n- Revisa 'Contenido' en Notion.\n\n")
+        block += f"{bold('Semana 2')}: ✍️ Práctica Intensiva\n"
+        block += e("- Realiza ejercicios tipo prueba.\n- Simula un examen real.\n- Repasa errores.\n")
+    elif days_until > 1:
+        # Dividimos los días restantes a la mitad
+        mid_point = days_until // 2
+        mid_date = (today + timedelta(days=mid_point)).strftime('%d-%m')
+        
+        block += f"⚡ {bold(f'Plan Intensivo ({days_until} días)')}\n"
+        block += f"📅 {bold(f'Días 1-{mid_point}')} {e(f'(Hoy - {mid_date}):')} 📖 {bold('Repaso Conceptual')}\n"
+        block += e("- Revisa tus notas y resúmenes.\n- Asegura los conceptos base.\n\n")
+        block += f"📅 {bold(f'Días {mid_point+1}-{days_until}')}: 🧨 {bold('Full Ejercicios')}\n"
+        block += e("- Resuelve exámenes pasados.\n- Cronometra tu tiempo.\n")
+    elif days_until == 1:
+        block += f"🚨 {bold('Plan de Emergencia (24h)')}\n"
+        block += e("- 🛑 No intentes aprender nada nuevo.\n")
+        block += e("- 🔄 Repasa solo lo que ya sabes para asegurarlo.\n")
+        block += e("- 💤 Duerme bien hoy. Es lo más importante.\n")
+    else:
+        block += f"🏁 {bold('¡Es hoy!')}\n🍀 {e('¡Mucho éxito! Tú sabes lo que sabes. Confía en ti.')}\n"
+    
+    block += e("-------------------------") + "\n"
+    return block
+
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Maneja TODOS los clics en botones (LOG, META, PLAN, POMO)."""
     query = update.callback_query
@@ -250,12 +371,31 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     data = query.data
     chat_id = update.effective_chat.id
     
+    # --- PAGINACIÓN (servida desde la caché, sin consultar Notion) ---
+    if data.startswith(PAGE_CALLBACK_PREFIX):
+        key, index = data[len(PAGE_CALLBACK_PREFIX):].rsplit(":", 1)
+        if index == "-":
+            return
+        pages = page_cache.get(key)
+        if pages is None:
+            await query.edit_message_reply_markup(reply_markup=None)
+            await context.bot.send_message(chat_id=chat_id, text="⌛ Este listado expiró. Vuelve a pedirlo con /proximos o /plan.")
+            return
+        index = min(int(index), len(pages) - 1)
+        await query.edit_message_text(
+            text=pages[index],
+            parse_mode=ParseMode.MARKDOWN_V2,
+            reply_markup=page_keyboard(key, index, len(pages)),
+            disable_web_page_preview=True
+        )
+
     # --- REGISTRO DE ESTUDIO (LOG) ---
-    if data.startswith("LOG:"):
-        subject = data.split("LOG:")[1]
-        is_new = log_study_session(chat_id, subject)
+    elif data.startswith("LOG:"):
+        user_id = update.effective_user.id  # en grupos, quien presionó el botón
+        subject = canonical_subject(user_id, data.split("LOG:")[1])
+        is_new = log_study_session(user_id, subject)
         
-        streak = get_current_streak(chat_id)
+        streak = get_current_streak(user_id)
         if streak > 1:
             streak_msg = f"\n🔥 **¡Racha de {streak} días!** ¡Sigue así!"
         elif streak == 1:
@@ -264,7 +404,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             streak_msg = ""
         
         if is_new:
-            progress_data = get_weekly_progress(chat_id)
+            progress_data = get_weekly_progress(user_id)
             p = progress_data.get(subject, {'current': 0, 'goal': 0, 'percentage': 0})
             current = p['current']
             msg = f"✅ ¡Registrado! **{subject}**\n📚 Llevas {current} sesiones.{streak_msg}"
@@ -287,9 +427,10 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # --- META: GUARDAR OBJETIVO ---
     elif data.startswith("META_SET:"):
         parts = data.split(":")
-        subject = parts[1]
+        user_id = update.effective_user.id  # en grupos, quien presionó el botón
+        subject = canonical_subject(user_id, parts[1])
         goal = int(parts[2])
-        set_study_goal(chat_id, goal, subject)
+        set_study_goal(user_id, goal, subject)
         await query.edit_message_text(f"✅ ¡Listo! Meta para **{subject}**: {goal} veces/semana.", parse_mode='Markdown')
 
     # --- PLAN DE ESTUDIO (GENERAR) ---
@@ -301,64 +442,29 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             subject_filter = data.split("PLAN_SEL:")[1]
             
         try:
-            client = NotionClient()
-            all_exams = client.get_upcoming_exams()
-            target_exams = []
-            
-            # Filtramos si el usuario pidió uno específico
-            if subject_filter:
-                for ex in all_exams:
-                    if ex.get('titulo') == subject_filter:
-                        target_exams.append(ex)
-            else:
-                target_exams = all_exams # Plan Global
-            
+            all_exams = await asyncio.to_thread(exam_cache.get_exams)
+            today = date.today()
+
+            # Plan Global: reparte sesiones entre todos los exámenes según capacidad y metas
+            if not subject_filter:
+                plan = get_plan(all_exams, exam_cache.version, get_goals(update.effective_user.id), today)
+                if not plan.exams:
+                    await query.edit_message_text("❌ No hay exámenes próximos para planificar.")
+                    return
+                await send_paginated(context.bot, chat_id, _render_global_plan(plan),
+                                     header=f"📅 {bold('Plan Global de Estudio')}\n\n",
+                                     answer_key=_answer_key(update))
+                return
+
+            # Filtramos el examen que pidió el usuario
+            target_exams = [ex for ex in all_exams if ex.titulo == subject_filter]
             if not target_exams:
                 await query.edit_message_text("❌ No encontré el examen solicitado.")
                 return
 
-            message = "📅 **Plan de Estudio**\n\n"
-            today = date.today()
-            
-            for exam in target_exams:
-                title = exam.get('titulo', 'Sin título')
-                date_str = exam.get('fecha')
-                if not date_str: continue
-                
-                exam_date = date.fromisoformat(date_str)
-                days_until = (exam_date - today).days
-                
-                start_week_2 = exam_date - timedelta(days=7)
-                
-                message += f"🎓 **{title}**\n🗓 {date_str} (en {days_until} días)\n\n"
-             
-                if days_until > 14:
-                    message += f"**Semana 1** (hasta {start_week_2.strftime('%d-%m')}): 📖 Teoría\n"
-                    message += f"- Lee la bibliografía.\n- Haz mapas conceptuales.\n- Revisa 'Contenido' en Notion.\n\n"
-                    message += f"**Semana 2**: ✍️ Práctica Intensiva\n"
-                    message += f"- Realiza ejercicios tipo prueba.\n- Simula un examen real.\n- Repasa errores.\n"
-                elif days_until > 1:
-                    # Dividimos los días restantes a la mitad
-                    mid_point = days_until // 2
-                    today_formatted = date.today().strftime('%d-%m')
-                    mid_date = (date.today() + timedelta(days=mid_point)).strftime('%d-%m')
-                    
-                    message += f"⚡ **Plan Intensivo ({days_until} días)**\n"
-                    message += f"📅 **Días 1-{mid_point}** (Hoy - {mid_date}): 📖 **Repaso Conceptual**\n"
-                    message += f"- Revisa tus notas y resúmenes.\n- Asegura los conceptos base.\n\n"
-                    message += f"📅 **Días {mid_point+1}-{days_until}**: 🧨 **Full Ejercicios**\n"
-                    message += f"- Resuelve exámenes pasados.\n- Cronometra tu tiempo.\n"
-                elif days_until == 1:
-                    message += f"🚨 **Plan de Emergencia (24h)**\n"
-                    message += f"- 🛑 No intentes aprender nada nuevo.\n"
-                    message += f"- 🔄 Repasa solo lo que ya sabes para asegurarlo.\n"
-                    message += f"- 💤 Duerme bien hoy. Es lo más importante.\n"
-                else:
-                    message += "🏁 **¡Es hoy!**\n🍀 ¡Mucho éxito! Tú sabes lo que sabes. Confía en ti.\n"
-                
-                message += "-------------------------\n"
-             
-            await context.bot.send_message(chat_id=chat_id, text=message, parse_mode='Markdown')
+            blocks = [_render_plan_block(exam, today) for exam in target_exams]
+            await send_paginated(context.bot, chat_id, blocks, header=f"📅 {bold('Plan de Estudio')}\n\n",
+                                 answer_key=_answer_key(update))
             
         except Exception as e:
             logging.error(f"Error Plan: {e}")
@@ -387,9 +493,9 @@ async def pomodoro(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def progreso(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manejador para /progreso. Muestra reporte semanal."""
-    chat_id = update.effective_chat.id
-    progress_data = get_weekly_progress(chat_id)
-    streak = get_current_streak(chat_id)
+    user_id = update.effective_user.id
+    progress_data = get_weekly_progress(user_id)
+    streak = get_current_streak(user_id)
     
     streak_header = f"🔥 **Racha Actual: {streak} días seguidos**\n\n" if streak > 1 else ""
     
@@ -418,6 +524,10 @@ async def progreso(update: Update, context: ContextTypes.DEFAULT_TYPE):
             msg += f"📚 {current} sesiones (Sin meta)\n\n"
             
     msg += f"🔥 **Total Semanal:** {total_sessions} sesiones"
+    
+    historic = sum(get_total_sessions(user_id).values())
+    if historic > total_sessions:
+        msg += f"\n📈 **Total Histórico:** {historic} sesiones"
         
     await update.message.reply_markdown(msg)
 
@@ -425,8 +535,7 @@ async def plan(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manejador para /plan. Genera plan de estudio estratégico."""
     await update.message.reply_text("⏳ Buscando exámenes...")
     try:
-        client = NotionClient()
-        exams = client.get_upcoming_exams()
+        exams = await asyncio.to_thread(exam_cache.get_exams)
         
         if not exams:
              await update.message.reply_text("🎉 No tienes exámenes próximos.")
@@ -434,7 +543,7 @@ async def plan(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         keyboard = []
         for exam in exams[:5]:
-            title = exam.get('titulo', 'Examen')
+            title = exam.titulo
             cb_data = f"PLAN_SEL:{title}"[:64]
             keyboard.append([InlineKeyboardButton(f"📅 {title}", callback_data=cb_data)])
             
@@ -444,6 +553,275 @@ async def plan(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         await update.message.reply_text(f"❌ Error: {e}")
 
+MONTH_NAMES = ["ene", "feb", "mar", "abr", "may", "jun", "jul", "ago", "sep", "oct", "nov", "dic"]
+HEAT_LEVELS = "·░▒▓█" # 0, 1, 2, 3, 4+ sesiones en el día
+
+async def historial(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Manejador para /historial. Mapa de calor de 12 meses y tendencia por materia."""
+    user_id = update.effective_user.id
+    today = date.today()
+    stats = get_history_stats(user_id, today)
+    
+    if not stats["total"]:
+        await update.message.reply_text("📭 Aún no tienes sesiones en el último año. ¡Registra una con /estudie!")
+        return
+
+    # Mapa de calor: una fila por mes, una columna por día
+    days = stats["days"]
+    year_start = today - timedelta(days=364)
+    rows = []
+    y, m = year_start.year, year_start.month
+    for _ in range(12 if year_start.day == 1 else 13):
+        cells = ""
+        month_total = 0
+        d = date(y, m, 1)
+        while d.month == m:
+            if year_start <= d <= today:
+                c = days.get(d, 0)
+                month_total += c
+                cells += HEAT_LEVELS[min(c, len(HEAT_LEVELS) - 1)]
+            else:
+                cells += " "
+            d += timedelta(days=1)
+        rows.append(f"{MONTH_NAMES[m - 1]} {cells.ljust(31)} {month_total:>3}")
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    
+    msg = "🗓 **Tu Historial (12 meses)**\n\n"
+    msg += "```\n" + "\n".join(rows) + "\n```\n"
+    msg += f"📚 **Total del año:** {stats['total']} sesiones\n\n"
+    
+    msg += "📈 **Promedio semanal (últimas 4 semanas vs 4 anteriores)**\n"
+    subjects = sorted(stats["subjects"].items(), key=lambda kv: kv[1]["total"], reverse=True)
+    for subj, st in subjects:
+        recent, previous = st["recent"], st["previous"]
+        if recent > previous:
+            trend = "⬆️"
+        elif recent < previous:
+            trend = "⬇️"
+        else:
+            trend = "➡️"
+        msg += f"{trend} **{subj}**: {recent:.1f}/sem (antes {previous:.1f})\n"
+    
+    await update.message.reply_markdown(msg)
+
+async def ranking(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Manejador para /ranking. Top del grupo por sesiones de la semana y por racha."""
+    chat = update.effective_chat
+    if chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+        await update.message.reply_text("👥 El ranking funciona en grupos. Agrégame a tu grupo de estudio y usen /estudie ahí.")
+        return
+
+    medals = ["🥇", "🥈", "🥉"]
+    msg = f"🏆 {bold('Ranking del grupo')}\n"
+    for metric, title, unit in (("week", "Sesiones esta semana", "sesiones"), ("streak", "Rachas", "días")):
+        msg += f"\n{bold(title)}\n"
+        top = get_ranking(chat.id, metric)
+        if not top:
+            msg += italic("Nadie todavía. ¡Sé el primero con /estudie!") + "\n"
+        for pos, (name, score) in enumerate(top):
+            prefix = medals[pos] if pos < len(medals) else f"{pos + 1}."
+            msg += escape_md(f"{prefix} {name}: {score} {unit}") + "\n"
+    await update.message.reply_text(msg, parse_mode=ParseMode.MARKDOWN_V2)
+
+async def member_left(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Saca del ranking a quien deja el grupo."""
+    user = update.message.left_chat_member
+    untrack_member(update.effective_chat.id, user.id)
+
+# Modo inline: artículos armados al cambiar los exámenes (nunca por consulta)
+inline_index = InlineIndex(render=_render_exam_block)
+exam_cache.add_listener(inline_index.rebuild)
+inline_debouncer = InlineDebouncer()
+
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Responde `@bot materia` con los próximos exámenes de esa materia desde la caché."""
+    query = update.inline_query
+    seq, wait = inline_debouncer.register(query.from_user.id)
+    if wait:
+        await asyncio.sleep(wait)
+        if not inline_debouncer.is_latest(query.from_user.id, seq):
+            metrics.incr("inline.debounced")
+            return
+
+    # Nunca consulta Notion: responde con lo que ya armó el listener (el job de refresco
+    # mantiene la caché al día; si Notion falla, siguen los últimos artículos buenos)
+    text = query.query.strip()
+    if text:
+        names = [name for name, _ in exam_cache.subjects.search(text, limit=MAX_INLINE_RESULTS)]
+        results = inline_index.results(names)
+    else:
+        results = inline_index.upcoming[:MAX_INLINE_RESULTS]
+    await query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=False)
+
+# Límite de descarga de archivos para bots de Telegram
+MAX_IMPORT_BYTES = 20 * 1024 * 1024
+
+async def importar(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Manejador para /importar. Deja al usuario listo para enviar su archivo de historial."""
+    context.user_data["awaiting_import"] = True
+    await update.message.reply_text(
+        "📥 Envíame tu historial como archivo:\n"
+        "- CSV con columnas fecha,materia (fecha en formato AAAA-MM-DD)\n"
+        "- JSON: lista u objetos por línea con \"fecha\" y \"materia\"\n\n"
+        "Las sesiones repetidas (misma materia y día) se omiten."
+    )
+
+async def importar_documento(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Recibe el archivo tras /importar y lo carga por lotes (fuera del loop de eventos)."""
+    # Cualquier otro archivo enviado al chat se ignora sin gastar el límite de frecuencia
+    if not context.user_data.get("awaiting_import"):
+        return
+    if _is_rate_limited(update):
+        return await _reply_throttled(update, context)
+    context.user_data.pop("awaiting_import", None)
+    doc = update.message.document
+    fmt = format_for(doc.file_name or "")
+    if fmt is None:
+        await update.message.reply_text("❌ Formato no soportado. Usa un archivo .csv, .json o .jsonl y vuelve a /importar.")
+        return
+    if doc.file_size and doc.file_size > MAX_IMPORT_BYTES:
+        await update.message.reply_text("❌ El archivo supera los 20 MB que permite Telegram.")
+        return
+
+    user_id = update.effective_user.id
+    await update.message.reply_text("⏳ Importando historial...")
+
+    def run_import(path):
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            return import_stream(user_id, f, fmt, notify=False)
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "import")
+            tg_file = await context.bot.get_file(doc.file_id)
+            await tg_file.download_to_drive(path)
+            stats = await asyncio.to_thread(run_import, path)
+    except (ValueError, UnicodeDecodeError) as e:
+        await update.message.reply_text(f"❌ No pude leer el archivo: {e}")
+        return
+    except Exception as e:
+        logging.error(f"Error importando historial: {e}", extra={"chat_id": user_id})
+        await update.message.reply_text("❌ Error importando el historial.")
+        return
+    finally:
+        # Rankings y reportes se actualizan aquí, en el hilo del bot (los lotes ya guardados cuentan)
+        notify_history_changed(user_id)
+
+    await update.message.reply_text(
+        f"✅ Importación lista.\n"
+        f"📚 Nuevas: {stats['imported']}\n"
+        f"🔁 Repetidas: {stats['duplicates']}\n"
+        f"⚠️ Inválidas: {stats['invalid']}"
+    )
+
+async def exportar(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Manejador para /exportar [json]. Envía el historial como archivo (CSV por defecto)."""
+    user_id = update.effective_user.id
+    fmt = "json" if context.args and context.args[0].lower() in ("json", "jsonl") else "csv"
+    filename = "historial.jsonl" if fmt == "json" else "historial.csv"
+
+    # Se escribe fila a fila a un archivo temporal, sin armar el historial en memoria
+    with tempfile.TemporaryFile("w+", encoding="utf-8", newline="") as f:
+        count = await asyncio.to_thread(export_to, user_id, f, fmt)
+        if not count:
+            await update.message.reply_text("📭 Aún no tienes sesiones para exportar.")
+            return
+        f.seek(0)
+        await update.message.reply_document(document=f.buffer, filename=filename,
+                                            caption=f"📤 Tu historial de estudio ({count} sesiones).")
+
+def _track_group_member(update: Update):
+    """Registra a quien usa el bot en un grupo, para el ranking."""
+    chat, user = update.effective_chat, update.effective_user
+    if chat and user and not user.is_bot and chat.type in (ChatType.GROUP, ChatType.SUPERGROUP):
+        track_member(chat.id, user.id, user.first_name)
+
+# Límite de frecuencia por chat y global delante de los handlers
+limiter = RateLimiter()
+
+# Últimas respuestas ya renderizadas por (chat, pedido), para contestar a un chat limitado
+# sin volver a calcular; y hasta cuándo ya se le avisó que espere (un aviso por espera)
+LAST_ANSWERS_SIZE = 1000
+_last_answers: "OrderedDict[tuple, tuple]" = OrderedDict()
+_cooldown_notified: "OrderedDict[int, float]" = OrderedDict()
+
+def _answer_key(update: Update) -> tuple:
+    """Identifica el pedido: el comando con sus argumentos, o el dato del botón."""
+    if update.callback_query:
+        return (update.effective_chat.id, update.callback_query.data)
+    text = update.message.text if update.message and update.message.text else ""
+    return (update.effective_chat.id, " ".join(text.split()))
+
+def _remember_answer(key: tuple, text: str, markup):
+    _last_answers[key] = (text, markup)
+    _last_answers.move_to_end(key)
+    if len(_last_answers) > LAST_ANSWERS_SIZE:
+        _last_answers.popitem(last=False)
+
+async def _reply_throttled(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Respuesta a un chat limitado: la última respuesta guardada o un aviso para esperar.
+    Se manda como máximo un mensaje por espera; el resto de los pedidos no recibe nada.
+    """
+    chat_id = update.effective_chat.id
+    if update.callback_query:
+        await update.callback_query.answer("⏳ Vas muy rápido, espera unos segundos.")
+    now = time.monotonic()
+    if _cooldown_notified.get(chat_id, 0) > now:
+        metrics.incr("rate_limit.suppressed")
+        return
+    wait = limiter.retry_after(chat_id)
+    _cooldown_notified[chat_id] = now + wait
+    _cooldown_notified.move_to_end(chat_id)
+    if len(_cooldown_notified) > LAST_ANSWERS_SIZE:
+        _cooldown_notified.popitem(last=False)
+
+    cached = _last_answers.get(_answer_key(update))
+    if cached:
+        metrics.incr("rate_limit.cached_answer")
+        text, markup = cached
+        await context.bot.send_message(chat_id=chat_id, text=text, parse_mode=ParseMode.MARKDOWN_V2,
+                                       reply_markup=markup, disable_web_page_preview=True)
+        return
+    if update.callback_query:
+        return
+    await update.effective_message.reply_text(f"⏳ Vas muy rápido. Espera {max(1, round(wait))} s y vuelve a intentarlo.")
+
+def _is_rate_limited(update: Update) -> bool:
+    chat = update.effective_chat
+    if chat is None:
+        return False
+    # Los botones de página se sirven desde la caché: no cuentan
+    query = update.callback_query
+    if query and query.data and query.data.startswith(PAGE_CALLBACK_PREFIX):
+        return False
+    return limiter.check(chat.id) is not None
+
+def instrument(command: str, callback, limited: bool = True):
+    """
+    Envuelve un handler para registrar chat_id, comando y duración (log muestreado)
+    y, si `limited`, aplicarle el límite de frecuencia.
+    """
+    register_handler(command, callback)
+    
+    @functools.wraps(callback)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        start_time = time.perf_counter()
+        try:
+            _track_group_member(update)
+            if limited and _is_rate_limited(update):
+                return await _reply_throttled(update, context)
+            return await callback(update, context)
+        finally:
+            chat = update.effective_chat
+            logging.info("Comando atendido", extra={
+                "chat_id": chat.id if chat else None,
+                "command": command,
+                "duration_ms": round((time.perf_counter() - start_time) * 1000, 1),
+                "sample": f"command:{command}",
+            })
+    return wrapper
+
 def create_bot_application():
     """Crea y configura la aplicación de Telegram."""
     token = os.getenv("TELEGRAM_TOKEN")
@@ -453,16 +831,29 @@ def create_bot_application():
     application = ApplicationBuilder().token(token).build()
     
     # Registrar comandos
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("proximos", proximos))
-    application.add_handler(CommandHandler("config", config))
-    application.add_handler(CommandHandler("meta", meta))
-    application.add_handler(CommandHandler("estudie", estudie))
-    application.add_handler(CommandHandler("progreso", progreso))
-    application.add_handler(CommandHandler("plan", plan))
-    application.add_handler(CommandHandler("pomodoro", pomodoro))
+    commands = {
+        "start": start,
+        "proximos": proximos,
+        "config": config,
+        "alertas": alertas,
+        "meta": meta,
+        "estudie": estudie,
+        "progreso": progreso,
+        "historial": historial,
+        "plan": plan,
+        "pomodoro": pomodoro,
+        "ranking": ranking,
+        "importar": importar,
+        "exportar": exportar,
+    }
+    for name, callback in commands.items():
+        application.add_handler(CommandHandler(name, instrument(name, callback)))
     
     # Registrar manejador de botones (Callbacks)
-    application.add_handler(CallbackQueryHandler(button_handler))
+    application.add_handler(CallbackQueryHandler(instrument("button", button_handler)))
+    application.add_handler(MessageHandler(filters.StatusUpdate.LEFT_CHAT_MEMBER, instrument("member_left", member_left, limited=False)))
+    application.add_handler(MessageHandler(filters.Document.ALL, instrument("importar_documento", importar_documento, limited=False)))
+    # block=False: la espera del debounce no debe frenar el resto de las actualizaciones
+    application.add_handler(InlineQueryHandler(instrument("inline", inline_query, limited=False), block=False))
     
     return application
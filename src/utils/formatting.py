@@ -0,0 +1,191 @@
+"""
+Motor de formato para mensajes de Telegram.
+
+- Escape correcto para MarkdownV2 (títulos con `*`, `_`, `(`... ya no rompen el mensaje).
+- Paginación: divide un listado en páginas de como máximo 4096 caracteres.
+- Caché de páginas ya renderizadas para que los botones "anterior/siguiente"
+  no vuelvan a consultar Notion ni a renderizar.
+"""
+import uuid
+from collections import OrderedDict
+from typing import List, Optional
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+# Límite de Telegram para el texto de un mensaje
+MAX_MESSAGE_LENGTH = 4096
+
+PAGE_CALLBACK_PREFIX = "PAGE:"
+
+_MD_V2_SPECIAL = "_*[]()~`>#+-=|{}.!\\"
+_MD_V2_TABLE = str.maketrans({c: "\\" + c for c in _MD_V2_SPECIAL})
+_MD_V2_URL_TABLE = str.maketrans({")": "\\)", "\\": "\\\\"})
+
+def escape_md(text) -> str:
+    """Escapa texto plano para MarkdownV2."""
+    return str(text).translate(_MD_V2_TABLE)
+
+def escape_md_url(url: str) -> str:
+    """Escapa la parte (url) de un link en MarkdownV2."""
+    return url.translate(_MD_V2_URL_TABLE)
+
+def bold(text) -> str:
+    return f"*{escape_md(text)}*"
+
+def italic(text) -> str:
+    return f"_{escape_md(text)}_"
+
+def link(label, url: str) -> str:
+    return f"[{escape_md(label)}]({escape_md_url(url)})"
+
+def tg_len(text: str) -> int:
+    """Largo según Telegram (unidades UTF-16: un emoji suele contar como 2)."""
+    return len(text.encode("utf-16-le")) // 2
+
+# Marcas de entidad de MarkdownV2 (las de varios caracteres primero)
+_MD_V2_MARKERS = ("```", "__", "||", "*", "_", "~", "`")
+_MD_V2_CODE = ("```", "`")
+
+def _link_end(text: str, start: int) -> Optional[int]:
+    """Fin de un link `[texto](url)` que empieza en `start`, o None si no es un link."""
+    i, n = start + 1, len(text)
+    while i < n and text[i] != "]":
+        i += 2 if text[i] == "\\" else 1
+    if i + 1 >= n or text[i + 1] != "(":
+        return None
+    i += 2
+    while i < n and text[i] != ")":
+        i += 2 if text[i] == "\\" else 1
+    return i + 1 if i < n else None
+
+def _md_tokens(text: str) -> List[str]:
+    """
+    Divide MarkdownV2 en piezas que no se pueden cortar: escapes (`\\x`), links
+    completos, marcas de entidad y caracteres sueltos.
+    """
+    tokens = []
+    i, n = 0, len(text)
+    while i < n:
+        char = text[i]
+        if char == "\\" and i + 1 < n:
+            tokens.append(text[i:i + 2])
+            i += 2
+            continue
+        if char == "[":
+            end = _link_end(text, i)
+            if end is not None:
+                tokens.append(text[i:end])
+                i = end
+                continue
+        for marker in _MD_V2_MARKERS:
+            if text.startswith(marker, i):
+                tokens.append(marker)
+                i += len(marker)
+                break
+        else:
+            tokens.append(char)
+            i += 1
+    return tokens
+
+def _toggle(stack: List[str], token: str) -> List[str]:
+    """Entidades abiertas después de `token` (dentro de código las marcas son texto)."""
+    if token not in _MD_V2_MARKERS:
+        return stack
+    if stack and stack[-1] in _MD_V2_CODE:
+        return stack[:-1] if token == stack[-1] else stack
+    if stack and stack[-1] == token:
+        return stack[:-1]
+    return stack + [token]
+
+def _split_block(block: str, limit: int) -> List[str]:
+    """
+    Corta un bloque demasiado largo, de preferencia en saltos de línea. Nunca corta un
+    escape ni un link, y las entidades abiertas (negrita, cursiva...) se cierran al
+    final de cada trozo y se vuelven a abrir al inicio del siguiente.
+    """
+    tokens = _md_tokens(block)
+    chunks = []
+    start, stack = 0, []
+    while start < len(tokens):
+        opening = "".join(stack)
+        size = tg_len(opening)
+        i, current = start, stack
+        last_newline = None  # (índice después del salto, entidades abiertas ahí)
+        while i < len(tokens):
+            token = tokens[i]
+            after = _toggle(current, token)
+            token_len = tg_len(token)
+            if i > start and size + token_len + tg_len("".join(after)) > limit:
+                break
+            size += token_len
+            current = after
+            i += 1
+            if token == "\n":
+                last_newline = (i, current)
+        if i < len(tokens) and last_newline is not None:
+            i, current = last_newline
+        chunks.append(opening + "".join(tokens[start:i]) + "".join(reversed(current)))
+        start, stack = i, current
+    return chunks
+
+def paginate(blocks: List[str], header: str = "", footer: str = "", limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """
+    Arma páginas de como máximo `limit` caracteres sin partir bloques
+    (un bloque = un examen). El encabezado va en cada página y el pie en la última.
+    """
+    header_len = tg_len(header)
+    room = limit - header_len
+    pieces = []
+    for block in blocks:
+        pieces.extend([block] if tg_len(block) <= room else _split_block(block, room))
+
+    pages = []
+    current, current_len = header, header_len
+    for piece in pieces:
+        piece_len = tg_len(piece)
+        if current_len + piece_len > limit and current != header:
+            pages.append(current)
+            current, current_len = header, header_len
+        current += piece
+        current_len += piece_len
+    if footer:
+        if current_len + tg_len(footer) > limit:
+            pages.append(current)
+            current = header
+        current += footer
+    pages.append(current)
+    return pages
+
+
+class PageCache:
+    """Caché LRU acotada de listados ya paginados: {clave: [página, ...]}."""
+
+    def __init__(self, max_entries: int = 500):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, List[str]]" = OrderedDict()
+
+    def put(self, pages: List[str]) -> str:
+        key = uuid.uuid4().hex[:12]
+        self._entries[key] = pages
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return key
+
+    def get(self, key: str) -> Optional[List[str]]:
+        pages = self._entries.get(key)
+        if pages is not None:
+            self._entries.move_to_end(key)
+        return pages
+
+def page_keyboard(key: str, index: int, total: int) -> Optional[InlineKeyboardMarkup]:
+    """Botones anterior/siguiente para la página `index` (None si hay una sola página)."""
+    if total <= 1:
+        return None
+    row = []
+    if index > 0:
+        row.append(InlineKeyboardButton("⬅️ Anterior", callback_data=f"{PAGE_CALLBACK_PREFIX}{key}:{index - 1}"))
+    # El indicador de página no hace nada (editar con el mismo texto da error en Telegram)
+    row.append(InlineKeyboardButton(f"{index + 1}/{total}", callback_data=f"{PAGE_CALLBACK_PREFIX}{key}:-"))
+    if index < total - 1:
+        row.append(InlineKeyboardButton("Siguiente ➡️", callback_data=f"{PAGE_CALLBACK_PREFIX}{key}:{index + 1}"))
+    return InlineKeyboardMarkup([row])
@@ -0,0 +1,96 @@
+"""
+Configuración de logging del bot.
+
+- Los handlers del loop de eventos solo encolan el registro (QueueHandler); un hilo
+  aparte (QueueListener) formatea y escribe a consola, así un envío masivo no
+  frena el bot esperando I/O.
+- Campos estructurados: pasa `extra={"chat_id": ..., "command": ..., "duration_ms": ...}`
+  y se agregan al final de la línea como clave=valor.
+- Muestreo: los registros con `extra={"sample": "clave"}` se limitan a SAMPLE_BURST
+  por SAMPLE_INTERVAL segundos por clave; el siguiente que pasa informa cuántos se omitieron.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Campos estructurados que se agregan a la línea si vienen en `extra`
+STRUCTURED_FIELDS = ("chat_id", "command", "duration_ms", "count", "suppressed")
+
+SAMPLE_INTERVAL = float(os.getenv("LOG_SAMPLE_INTERVAL", "60"))
+SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "5"))
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formato clásico + campos estructurados como clave=valor."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = [f"{name}={getattr(record, name)}" for name in STRUCTURED_FIELDS if hasattr(record, name)]
+        return f"{line} | {' '.join(fields)}" if fields else line
+
+
+class SamplingFilter(logging.Filter):
+    """Limita los registros marcados con `sample` a `burst` por `interval` segundos por clave."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL, burst: int = SAMPLE_BURST):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._windows: Dict[str, List[float]] = {}  # clave -> [inicio_ventana, emitidos, omitidos]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample", None)
+        if key is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = int(window[2]) if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+def setup_logging(level: int = logging.INFO):
+    """Configura el logging raíz con cola + hilo escritor (idempotente)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(StructuredFormatter(LOG_FORMAT))
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    # httpx registra cada request a nivel INFO; basta con advertencias
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
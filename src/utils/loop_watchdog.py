@@ -0,0 +1,132 @@
+"""
+Watchdog del loop de eventos.
+
+Una tarea asíncrona mide continuamente el retraso ("lag") del loop: duerme un
+intervalo fijo y compara cuánto tardó realmente en despertar. En paralelo, un
+hilo vigila esos latidos; si el loop lleva más de LOOP_LAG_THRESHOLD sin latir,
+captura la pila del hilo del loop para señalar la llamada bloqueante y el
+handler/job que estaba corriendo.
+
+`snapshot()` resume el estado para el endpoint de salud: si el loop está
+crónicamente atrasado (muchas muestras sobre el umbral), `healthy` es False.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+# Segundos entre latidos y retraso considerado "bloqueo"
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.25"))
+# Fracción de muestras atrasadas (en la ventana) a partir de la cual el bot no está "ready"
+LOOP_LAG_UNHEALTHY_RATIO = float(os.getenv("LOOP_LAG_UNHEALTHY_RATIO", "0.5"))
+WINDOW_SAMPLES = 120
+
+# Código de los handlers/jobs conocidos -> nombre, para identificarlos en la pila
+_handler_codes: Dict[Any, str] = {}
+
+def register_handler(name: str, func):
+    """Registra un handler o job para poder nombrarlo cuando bloquee el loop."""
+    code = getattr(func, "__code__", None)
+    if code is not None:
+        _handler_codes[code] = name
+
+
+class LoopWatchdog:
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_LAG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.samples: Deque[Tuple[float, float]] = deque(maxlen=WINDOW_SAMPLES)  # (momento, lag)
+        self.stalls = 0
+        self.last_block: Optional[Dict[str, Any]] = None
+        self._last_beat: Optional[float] = None
+        self._loop_thread_id: Optional[int] = None
+        self._captured_beat: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Arranca el latido en `loop` y el hilo vigilante (llamar desde el loop)."""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = loop.create_task(self._heartbeat())
+        threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True).start()
+
+    async def _heartbeat(self):
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - before - self.interval)
+            self.samples.append((now, lag))
+            self._last_beat = now
+            if lag > self.threshold:
+                self.stalls += 1
+                logging.warning(
+                    f"Loop de eventos atrasado {lag * 1000:.0f} ms",
+                    extra={"duration_ms": round(lag * 1000), "sample": "loop_lag"}
+                )
+
+    def _monitor(self):
+        """Hilo: si el loop no late a tiempo, captura la pila del hilo del loop (una vez por bloqueo)."""
+        while True:
+            time.sleep(self.interval / 2)
+            beat = self._last_beat
+            if beat is None or beat == self._captured_beat:
+                continue
+            blocked_for = time.monotonic() - beat - self.interval
+            if blocked_for > self.threshold:
+                self._captured_beat = beat
+                self._capture(blocked_for)
+
+    def _capture(self, blocked_for: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)
+        handler = None
+        f = frame
+        while f is not None:
+            name = _handler_codes.get(f.f_code)
+            if name:
+                handler = name  # seguir subiendo: nos quedamos con el más externo
+            f = f.f_back
+        self.last_block = {
+            "at": time.time(),
+            "blocked_ms": round(blocked_for * 1000),
+            "handler": handler,
+            "stack": [f"{s.filename}:{s.lineno} in {s.name}" for s in stack[-8:]],
+        }
+        logging.warning(
+            f"Loop bloqueado en handler '{handler}':\n" + "".join(traceback.format_list(stack[-8:])),
+            extra={"command": handler, "duration_ms": round(blocked_for * 1000), "sample": "loop_block"}
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado para el endpoint de salud."""
+        now = time.monotonic()
+        lags = [lag for _, lag in self.samples]
+        late = sum(1 for lag in lags if lag > self.threshold)
+        # Bloqueo en curso: el loop no late desde hace rato
+        current_block = 0.0 if self._last_beat is None else max(0.0, now - self._last_beat - self.interval)
+        starved = bool(lags) and late / len(lags) >= LOOP_LAG_UNHEALTHY_RATIO
+        return {
+            "healthy": self._task is not None and not starved and current_block <= self.threshold * 20,
+            "lag_ms": round(lags[-1] * 1000, 1) if lags else None,
+            "max_lag_ms": round(max(lags) * 1000, 1) if lags else None,
+            "late_samples": late,
+            "samples": len(lags),
+            "current_block_ms": round(current_block * 1000),
+            "stalls_total": self.stalls,
+            "last_block": self.last_block,
+        }
+
+
+# Instancia única del proceso
+watchdog = LoopWatchdog()
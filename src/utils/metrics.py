@@ -0,0 +1,21 @@
+"""
+Contadores del proceso (en memoria), expuestos en /health.
+
+Uso: `metrics.incr("rate_limit.chat")`. Son seguros entre hilos y baratos: un
+diccionario y un lock, sin dependencias externas.
+"""
+import threading
+from collections import Counter
+from typing import Dict
+
+_counters: Counter = Counter()
+_lock = threading.Lock()
+
+def incr(name: str, amount: int = 1):
+    with _lock:
+        _counters[name] += amount
+
+def snapshot() -> Dict[str, int]:
+    """Copia de todos los contadores."""
+    with _lock:
+        return dict(_counters)
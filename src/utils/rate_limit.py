@@ -0,0 +1,95 @@
+"""
+Limitador de frecuencia con token buckets: uno por chat y uno global.
+
+Cada bucket se recarga a `rate` fichas por segundo hasta `burst`. Una petición
+pasa si hay ficha en el bucket de su chat y en el global. Los buckets por chat
+viven en un LRU de tamaño fijo: un chat que no se usa hace rato se olvida
+(y vuelve con el bucket lleno, que es el mismo estado al que habría llegado).
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from src.utils import metrics
+
+# Por chat: ráfaga y recarga (peticiones por minuto)
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "5"))
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "20"))
+# Global (todo el bot): ráfaga y recarga (peticiones por segundo)
+GLOBAL_RATE_BURST = int(os.getenv("GLOBAL_RATE_BURST", "30"))
+GLOBAL_RATE_PER_SECOND = float(os.getenv("GLOBAL_RATE_PER_SECOND", "10"))
+# Máximo de chats con bucket en memoria
+RATE_LIMIT_MAX_CHATS = int(os.getenv("RATE_LIMIT_MAX_CHATS", "10000"))
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: int, now: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def has_token(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= 1
+
+    def take(self):
+        self.tokens -= 1
+
+    def retry_after(self) -> float:
+        """Segundos hasta la próxima ficha."""
+        return max(0.0, (1 - self.tokens) / self.rate) if self.rate else float("inf")
+
+
+class RateLimiter:
+    def __init__(self, per_chat_rate: float = RATE_LIMIT_PER_MINUTE / 60, per_chat_burst: int = RATE_LIMIT_BURST,
+                 global_rate: float = GLOBAL_RATE_PER_SECOND, global_burst: int = GLOBAL_RATE_BURST,
+                 max_chats: int = RATE_LIMIT_MAX_CHATS):
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_chats = max_chats
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self._chats: "OrderedDict[int, TokenBucket]" = OrderedDict()
+
+    def _chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.per_chat_rate, self.per_chat_burst, now)
+            self._chats[chat_id] = bucket
+            if len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    def check(self, chat_id: int) -> Optional[str]:
+        """
+        Consume una ficha del chat y una global. Devuelve None si la petición pasa,
+        o "chat" / "global" según qué límite la rechazó (y no consume nada).
+        """
+        now = time.monotonic()
+        bucket = self._chat_bucket(chat_id, now)
+        if not bucket.has_token(now):
+            metrics.incr("rate_limit.rejected.chat")
+            return "chat"
+        if not self.global_bucket.has_token(now):
+            metrics.incr("rate_limit.rejected.global")
+            return "global"
+        bucket.take()
+        self.global_bucket.take()
+        return None
+
+    def retry_after(self, chat_id: int) -> float:
+        bucket = self._chats.get(chat_id)
+        wait = bucket.retry_after() if bucket else 0.0
+        return max(wait, self.global_bucket.retry_after())
+
+    def __len__(self):
+        return len(self._chats)
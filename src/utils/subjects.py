@@ -0,0 +1,156 @@
+"""
+Normalización y búsqueda aproximada de nombres de materia.
+
+- `normalize_subject` pliega mayúsculas, tildes y espacios: "  Cálculo  I" -> "calculo i".
+- `SubjectIndex` guarda materias conocidas con un índice invertido de trigramas,
+  así una búsqueda solo recorre las materias que comparten trigramas con la
+  consulta (no todas). Sirve para:
+  * canonizar al escribir, solo por coincidencia exacta normalizada: "calculo" se
+    guarda como el "Cálculo" ya conocido, y
+  * buscar o sugerir con tolerancia a errores ("calclo" encuentra "Cálculo").
+    Lo aproximado nunca renombra datos guardados: "Cálculo II" no es "Cálculo I".
+"""
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+# Similitud mínima (Dice sobre trigramas) para sugerir un nombre conocido,
+# y ventaja mínima sobre el segundo candidato (si hay empate, no se adivina)
+SUGGEST_MIN_SCORE = 0.6
+SUGGEST_MARGIN = 0.1
+# Puntaje mínimo para que una materia aparezca en una búsqueda
+SEARCH_MIN_SCORE = 0.45
+
+_ROMAN_NUMERALS = frozenset(("i", "ii", "iii", "iv", "v", "vi", "vii", "viii", "ix", "x"))
+
+
+@lru_cache(maxsize=8192)
+def normalize_subject(name: str) -> str:
+    """Minúsculas, sin tildes y con espacios colapsados."""
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+def exam_subjects(materia: str) -> List[str]:
+    """Materias normalizadas de un examen ("A, B" si en Notion es multi-select)."""
+    return [normalize_subject(part) for part in materia.split(",") if part.strip()]
+
+def clean_subject(name: str) -> str:
+    """Nombre para mostrar/guardar: solo colapsa espacios (respeta tildes y mayúsculas)."""
+    return " ".join(name.split())
+
+@lru_cache(maxsize=8192)
+def trigrams(normalized: str) -> Tuple[str, ...]:
+    padded = f"  {normalized} "
+    return tuple(sorted({padded[i:i + 3] for i in range(len(padded) - 2)}))
+
+def numbering(normalized: str) -> Tuple[str, ...]:
+    """Números y romanos de un nombre normalizado: "calculo ii" -> ("ii",)."""
+    return tuple(t for t in normalized.split() if t.isdigit() or t in _ROMAN_NUMERALS)
+
+def _min_shared(dice: float) -> float:
+    """
+    Fracción de los trigramas de la consulta que debe compartir una materia para
+    alcanzar ese Dice: 2c/(n+m) >= d con m >= c implica c >= d*n/(2-d).
+    """
+    return dice / (2 - dice)
+
+
+class SubjectIndex:
+    """Materias conocidas (nombre original por forma normalizada) con índice de trigramas."""
+    __slots__ = ("names", "_ids", "_postings", "_sizes")
+
+    def __init__(self, names=()):
+        self.names: List[str] = []          # id -> nombre tal como se conoció primero
+        self._ids: Dict[str, int] = {}      # forma normalizada -> id
+        self._postings: Dict[str, List[int]] = {}
+        self._sizes: List[int] = []
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return normalize_subject(name) in self._ids
+
+    def add(self, name: str) -> str:
+        """Agrega una materia (si no estaba) y devuelve su nombre canónico."""
+        key = normalize_subject(name)
+        sid = self._ids.get(key)
+        if sid is not None:
+            return self.names[sid]
+        if not key:
+            return name
+        sid = len(self.names)
+        self._ids[key] = sid
+        self.names.append(name)
+        grams = trigrams(key)
+        self._sizes.append(len(grams))
+        for gram in grams:
+            self._postings.setdefault(gram, []).append(sid)
+        return name
+
+    def get(self, name: str) -> Optional[str]:
+        """Coincidencia exacta ignorando mayúsculas, tildes y espacios."""
+        sid = self._ids.get(normalize_subject(name))
+        return None if sid is None else self.names[sid]
+
+    def _scores(self, key: str, min_common: float = 0.0) -> List[Tuple[float, float, int]]:
+        """
+        [(dice, cobertura de la consulta, id)] de las materias que comparten al menos
+        `min_common` (fracción de los trigramas de la consulta) trigramas.
+        """
+        grams = trigrams(key)
+        if not grams:
+            return []
+        shared = Counter()
+        for gram in grams:
+            postings = self._postings.get(gram)
+            if postings:
+                shared.update(postings)
+        n = len(grams)
+        floor = min_common * n
+        sizes = self._sizes
+        return [(2 * common / (n + sizes[sid]), common / n, sid)
+                for sid, common in shared.items() if common >= floor]
+
+    def search(self, query: str, limit: int = 10, min_score: float = SEARCH_MIN_SCORE) -> List[Tuple[str, float]]:
+        """
+        Materias parecidas a `query`, de mayor a menor puntaje.
+        El puntaje premia también que la consulta esté contenida ("calc" -> "Cálculo I").
+        """
+        key = normalize_subject(query)
+        results = []
+        for dice, coverage, sid in self._scores(key, _min_shared(min_score)):
+            score = max(dice, 0.9 * coverage)
+            if score >= min_score:
+                results.append((score, sid))
+        results.sort(key=lambda r: (-r[0], r[1]))
+        return [(self.names[sid], score) for score, sid in results[:limit]]
+
+    def suggest(self, name: str) -> Optional[str]:
+        """
+        Sugerencia para `name`: la coincidencia exacta normalizada o, si no hay, la materia
+        claramente más parecida (typos). None si no hay una clara. Solo para sugerir.
+        Nunca cruza numeración distinta: "Cálculo II" no sugiere "Cálculo I".
+        """
+        key = normalize_subject(name)
+        sid = self._ids.get(key)
+        if sid is not None:
+            return self.names[sid]
+        best = second = 0.0
+        best_sid = None
+        numbers = numbering(key)
+        # Basta mirar candidatos que podrían quedar a menos del margen del mínimo
+        for dice, _, sid in self._scores(key, _min_shared(SUGGEST_MIN_SCORE - SUGGEST_MARGIN)):
+            if numbering(normalize_subject(self.names[sid])) != numbers:
+                continue
+            if dice > best:
+                best, second, best_sid = dice, best, sid
+            elif dice > second:
+                second = dice
+        if best_sid is not None and best >= SUGGEST_MIN_SCORE and best - second >= SUGGEST_MARGIN:
+            return self.names[best_sid]
+        return None
@@ -0,0 +1,104 @@
+from datetime import date, timedelta
+
+import pytest
+
+from src.models import Exam
+from src.services import exam_cache as exam_cache_module
+from src.services.exam_cache import ExamCache
+from src.services.notion_service import NotionError
+
+
+class FakeNotion:
+    """Reemplaza a NotionClient: devuelve `exams` o lanza `error`, y cuenta las consultas."""
+    calls = 0
+    exams = []
+    error = None
+
+    def get_upcoming_exams(self):
+        FakeNotion.calls += 1
+        if FakeNotion.error:
+            raise FakeNotion.error
+        return list(FakeNotion.exams)
+
+
+@pytest.fixture
+def notion(monkeypatch):
+    FakeNotion.calls = 0
+    FakeNotion.exams = [Exam("Certamen 1", date.today() + timedelta(days=2), "Cálculo", "", "")]
+    FakeNotion.error = None
+    monkeypatch.setattr(exam_cache_module, "NotionClient", FakeNotion)
+    return FakeNotion
+
+
+def _expire(cache):
+    cache._fetched_at -= cache.ttl + 1
+
+
+def test_failure_serves_last_good_exams_and_backs_off(notion):
+    cache = ExamCache(ttl=60)
+    good = cache.get_exams()
+    _expire(cache)
+    notion.error = RuntimeError("caído")
+
+    assert cache.get_exams() == good
+    assert cache.in_backoff
+    # Durante la espera no se vuelve a consultar Notion
+    for _ in range(5):
+        assert cache.get_exams() == good
+    assert notion.calls == 2
+
+
+def test_retry_after_is_honored_and_success_clears_backoff(notion):
+    cache = ExamCache(ttl=600)
+    notion.error = NotionError("429", retry_after=120)
+
+    with pytest.raises(NotionError):
+        cache.get_exams()
+    assert 110 < cache._retry_at - exam_cache_module.time.monotonic() <= 120
+    with pytest.raises(NotionError):
+        cache.get_exams()
+    assert notion.calls == 1
+
+    notion.error = None
+    cache._retry_at = exam_cache_module.time.monotonic() - 1
+    assert len(cache.get_exams()) == 1
+    assert not cache.in_backoff and cache._failures == 0
+
+
+def test_backoff_doubles_up_to_ttl(notion, monkeypatch):
+    monkeypatch.setattr(exam_cache_module, "EXAM_CACHE_RETRY", 30)
+    cache = ExamCache(ttl=100)
+    notion.error = RuntimeError("caído")
+    delays = []
+    for _ in range(4):
+        with pytest.raises(RuntimeError):
+            cache.refresh()
+        delays.append(round(cache._retry_at - exam_cache_module.time.monotonic()))
+    assert delays == [30, 60, 100, 100]
+
+
+def test_imminent_never_queries_notion(notion):
+    cache = ExamCache()
+    assert len(cache.imminent()) == 0
+    assert notion.calls == 0
+
+    cache.refresh()
+    view = cache.imminent()
+    assert len(view) == 1 and view.days_left == [2]
+    assert notion.calls == 1
+
+
+def test_view_is_rebuilt_when_data_changes(notion):
+    cache = ExamCache()
+    cache.refresh()
+    first = cache.imminent()
+    notion.exams = notion.exams + [Exam("Tarea", date.today(), "Física", "", "")]
+    cache.refresh()
+    view = cache.imminent()
+    assert view is not first
+    assert [e.titulo for e in view.exams] == ["Tarea", "Certamen 1"]
+    # Mismo día y mismos datos: se reutiliza la vista
+    assert cache.imminent() is view
+    # Otro día: se rehace con los datos en caché
+    tomorrow = cache.imminent(date.today() + timedelta(days=1))
+    assert tomorrow.days_left == [1] and notion.calls == 2
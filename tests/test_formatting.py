@@ -0,0 +1,65 @@
+from src.utils.formatting import (
+    _md_tokens, _split_block, _toggle, bold, escape_md, italic, link, paginate, tg_len
+)
+
+LIMIT = 4096
+
+
+def _open_entities(text):
+    stack = []
+    for token in _md_tokens(text):
+        stack = _toggle(stack, token)
+    return stack
+
+
+def _plain(text):
+    """Texto visible: sin marcas de entidad y con los escapes resueltos."""
+    return "".join(t[1] if t.startswith("\\") and len(t) == 2 else t
+                   for t in _md_tokens(text) if t not in ("*", "_", "__", "~", "||", "`", "```"))
+
+
+def _assert_valid_pages(pages, limit=LIMIT):
+    for page in pages:
+        assert tg_len(page) <= limit
+        assert _open_entities(page) == []
+        # Un "\" suelto al final escaparía lo que sigue en el mensaje
+        assert _md_tokens(page)[-1] != "\\"
+
+
+def test_long_italic_is_closed_and_reopened_on_each_page():
+    pages = paginate([italic("x" * 5000)])
+    assert len(pages) == 2
+    assert all(p.startswith("_") and p.endswith("_") for p in pages)
+    _assert_valid_pages(pages)
+    assert "".join(_plain(p) for p in pages) == "x" * 5000
+
+
+def test_escapes_are_never_split():
+    text = "\\" * 5000 + "." * 3000
+    pages = paginate([escape_md(text)])
+    _assert_valid_pages(pages)
+    for page in pages:
+        assert all(len(t) == 2 for t in _md_tokens(page))
+    assert "".join(_plain(p) for p in pages) == text
+
+
+def test_prefers_line_breaks_and_keeps_links_whole():
+    line = f"{bold('Cálculo')}: {link('Certamen (1)', 'https://example.com/a_b')}\n"
+    block = line * 300
+    chunks = _split_block(block, 1000)
+    _assert_valid_pages(chunks, 1000)
+    assert all(c.endswith("\n") for c in chunks)
+    assert "".join(chunks) == block
+
+
+def test_entities_spanning_lines_stay_balanced():
+    block = bold("\n".join("fila %d" % i for i in range(800))) + "\n" + italic("fin")
+    pages = paginate([block], header="*Encabezado*\n\n", footer="\n_pie_")
+    _assert_valid_pages(pages)
+    assert all(p.startswith("*Encabezado*\n\n") for p in pages)
+    assert pages[-1].endswith("_pie_")
+
+
+def test_short_blocks_are_not_split():
+    blocks = [bold(f"Examen {i}") + "\n" for i in range(10)]
+    assert paginate(blocks) == ["".join(blocks)]
@@ -0,0 +1,104 @@
+import glob
+import json
+
+import pytest
+
+from src.services import data_service, migrations, subscription_service
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    paths = {
+        "user_data": tmp_path / "user_data.json",
+        "chat_ids": tmp_path / "chat_ids.json",
+        "schema": tmp_path / "schema_version.json",
+    }
+    monkeypatch.setattr(data_service, "DATA_FILE", str(paths["user_data"]))
+    monkeypatch.setattr(subscription_service, "CHAT_IDS_FILE", str(paths["chat_ids"]))
+    monkeypatch.setattr(migrations, "SCHEMA_VERSION_FILE", str(paths["schema"]))
+    return paths
+
+
+def _write(path, data):
+    path.write_text(json.dumps(data))
+
+
+def _read(path):
+    return json.loads(path.read_text())
+
+
+def _legacy_files(files):
+    _write(files["user_data"], {
+        "123": {"study_goal": 4, "study_sessions": ["2026-01-05", {"date": "2026-01-06", "subject": "Física"}]},
+    })
+    _write(files["chat_ids"], [123, 456])
+
+
+def test_legacy_files_are_migrated(files):
+    _legacy_files(files)
+
+    applied = migrations.run_migrations()
+
+    assert applied == {str(files["user_data"]): 2, str(files["chat_ids"]): 1}
+    user = _read(files["user_data"])["123"]
+    assert user["goals"] == {"General": 4}
+    assert "study_goal" not in user and "study_sessions" not in user
+    assert user["sessions"] == [
+        {"date": "2026-01-05", "subject": "General"},
+        {"date": "2026-01-06", "subject": "Física"},
+    ]
+    assert _read(files["chat_ids"]) == {
+        "123": {"time": subscription_service.DEFAULT_TIME},
+        "456": {"time": subscription_service.DEFAULT_TIME},
+    }
+    assert _read(files["schema"]) == {
+        "user_data": migrations.latest_version("user_data"),
+        "chat_ids": migrations.latest_version("chat_ids"),
+    }
+
+
+def test_backup_keeps_the_original_file(files):
+    _legacy_files(files)
+    original = files["user_data"].read_text()
+
+    migrations.run_migrations()
+
+    backups = glob.glob(f"{files['user_data']}.bak-v0-*")
+    assert len(backups) == 1
+    with open(backups[0]) as f:
+        assert f.read() == original
+    assert glob.glob(f"{files['chat_ids']}.bak-v0-*")
+
+
+def test_second_run_is_a_noop(files):
+    _legacy_files(files)
+    migrations.run_migrations()
+    migrated = files["user_data"].read_text()
+    backups = sorted(glob.glob(f"{files['user_data']}.bak-*"))
+
+    assert migrations.run_migrations() == {}
+    assert files["user_data"].read_text() == migrated
+    assert sorted(glob.glob(f"{files['user_data']}.bak-*")) == backups
+
+
+def test_missing_files_are_recorded_at_latest_version(files):
+    assert migrations.run_migrations() == {}
+
+    assert not files["user_data"].exists()
+    assert _read(files["schema"]) == {
+        "user_data": migrations.latest_version("user_data"),
+        "chat_ids": migrations.latest_version("chat_ids"),
+    }
+    # Un archivo creado después ya nace en el formato nuevo: no se vuelve a migrar
+    _write(files["user_data"], {"1": {"study_goal": 2}})
+    assert migrations.run_migrations() == {}
+    assert _read(files["user_data"]) == {"1": {"study_goal": 2}}
+
+
+def test_pending_steps_only(files):
+    _write(files["user_data"], {"1": {"goals": {"General": 2}, "study_sessions": ["2026-01-05"]}})
+    _write(files["schema"], {"user_data": 1, "chat_ids": migrations.latest_version("chat_ids")})
+
+    assert migrations.run_migrations() == {str(files["user_data"]): 1}
+    assert _read(files["user_data"])["1"]["sessions"] == [{"date": "2026-01-05", "subject": "General"}]
+    assert glob.glob(f"{files['user_data']}.bak-v1-*")
@@ -0,0 +1,91 @@
+import pytest
+
+from src.services import notion_service
+from src.services.notion_service import NotionClient, _compile_decoder
+
+NAMES = {"date": "Date", "title": "Name", "subject": "Ramo", "content": "Contenido"}
+SCHEMA = {"Date": {"type": "date"}, "Name": {"type": "title"},
+          "Ramo": {"type": "multi_select"}, "Contenido": {"type": "rich_text"}}
+PAGE = {
+    "url": "https://www.notion.so/p",
+    "properties": {
+        "Date": {"type": "date", "date": {"start": "2026-10-20T10:00:00.000-03:00"}},
+        "Name": {"type": "title", "title": [{"plain_text": "Certamen "}, {"plain_text": "1"}]},
+        "Ramo": {"type": "multi_select", "multi_select": [{"name": "Cálculo"}, {"name": "Física"}]},
+        "Contenido": {"type": "rich_text", "rich_text": []},
+    },
+}
+
+
+class FakeResponse:
+    def __init__(self, ok):
+        self.ok = ok
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise RuntimeError("500")
+
+    def json(self):
+        return {"properties": SCHEMA}
+
+
+class FakeHttp:
+    def __init__(self, ok):
+        self.ok = ok
+        self.calls = 0
+
+    def get(self, *args, **kwargs):
+        self.calls += 1
+        return FakeResponse(self.ok)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("NOTION_TOKEN", "token")
+    monkeypatch.setenv("NOTION_DB_ID", "db")
+    monkeypatch.setattr(notion_service, "_DECODER_CACHE", {})
+    monkeypatch.setattr(notion_service, "_SCHEMA_RETRY_AT", {})
+    return NotionClient()
+
+
+def _fields(exam):
+    return (exam.titulo, exam.fecha, exam.materia, exam.contenido, exam.url)
+
+
+def test_dynamic_and_compiled_decoders_agree():
+    compiled = _compile_decoder(SCHEMA, NAMES)(PAGE)
+    assert _fields(compiled) == _fields(_compile_decoder(None, NAMES)(PAGE))
+    assert compiled.materia == "Cálculo, Física" and compiled.titulo == "Certamen 1"
+
+
+def test_schema_failure_caches_fallback_until_retry(client):
+    http = FakeHttp(ok=False)
+    fallback = client._get_decoder(http)
+    assert client._get_decoder(http) is fallback
+    assert http.calls == 1
+
+    # Pasada la espera se vuelve a pedir el esquema; si responde, se compila
+    notion_service._SCHEMA_RETRY_AT["db"] = 0
+    http.ok = True
+    compiled = client._get_decoder(http)
+    assert compiled is not fallback and http.calls == 2
+    assert client._get_decoder(http) is compiled and http.calls == 2
+
+
+def test_changed_property_type_is_read_and_schema_invalidated(client):
+    client._get_decoder(FakeHttp(ok=True))
+    assert "db" in notion_service._DECODER_CACHE
+    decoder = notion_service._DECODER_CACHE["db"]
+    # En Notion "Ramo" pasó de multi_select a select
+    page = {"url": "", "properties": dict(PAGE["properties"], Ramo={"type": "select", "select": {"name": "Química"}})}
+
+    assert decoder(page).materia == "Química"
+    assert "db" not in notion_service._DECODER_CACHE
+
+
+def test_empty_values_keep_the_compiled_schema(client):
+    decoder = client._get_decoder(FakeHttp(ok=True))
+    page = {"url": "", "properties": dict(PAGE["properties"], Ramo={"type": "multi_select", "multi_select": []})}
+
+    assert decoder(page).materia == "Sin Materia"
+    assert notion_service._DECODER_CACHE["db"] is decoder
@@ -0,0 +1,29 @@
+from datetime import date, timedelta
+
+from src.models import Exam
+from src.services.planner import build_plan
+
+TODAY = date(2026, 10, 19)
+
+
+def _exam(title, days, subject="Cálculo"):
+    return Exam(title, TODAY + timedelta(days=days), subject, "", "")
+
+
+def test_exams_due_today_stay_in_the_summary():
+    plan = build_plan([_exam("Control", 0), _exam("Certamen", 3), _exam("Pasado", -1)], {}, TODAY)
+
+    assert [e.titulo for e in plan.exams] == ["Control", "Certamen"]
+    assert plan.needed[0] == 0 and plan.assigned[0] == 0 and plan.shortfall(0) == 0
+    assert all(0 not in indices for _, indices in plan.days)
+    assert plan.assigned[1] == plan.needed[1] > 0
+
+
+def test_sessions_fit_before_each_exam_and_daily_capacity():
+    exams = [_exam(f"E{i}", 2 + i, "Física") for i in range(5)]
+    plan = build_plan(exams, {"fisica": 7}, TODAY, capacity=2)
+
+    for day, indices in plan.days:
+        assert len(indices) <= 2
+        assert all(day < plan.exams[i].fecha for i in indices)
+    assert sum(plan.assigned) == sum(len(ix) for _, ix in plan.days)
@@ -0,0 +1,89 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from src.models import Session
+from src.services import report_service
+
+SUNDAY = datetime(2026, 10, 18, 21, 0)
+
+
+@pytest.fixture
+def reports(tmp_path, monkeypatch):
+    monkeypatch.setattr(report_service, "REPORTS_FILE", str(tmp_path / "weekly_reports.json"))
+    monkeypatch.setattr(report_service, "_state", None)
+    monkeypatch.setattr(report_service, "build_report", lambda chat_id: f"reporte {chat_id}")
+    return tmp_path / "weekly_reports.json"
+
+
+def _subscriptions(*chat_ids):
+    return {cid: {"report_time": "20:00"} for cid in chat_ids}
+
+
+def test_failed_sends_are_retried_up_to_the_limit(reports, monkeypatch):
+    monkeypatch.setattr(report_service, "REPORT_MAX_ATTEMPTS", 2)
+    subs = _subscriptions("1", "2")
+    due = report_service.due_reports(subs, SUNDAY)
+    assert [cid for cid, _ in due] == ["1", "2"]
+
+    report_service.mark_delivered([cid for cid, _ in due], ["2"], SUNDAY)
+    assert report_service.due_reports(subs, SUNDAY) == []
+    later = SUNDAY.replace(minute=report_service.REPORT_RETRY_MINUTES)
+    assert report_service.due_reports(subs, later) == [("2", "reporte 2")]
+
+    report_service.mark_delivered(["2"], ["2"], later)
+    assert report_service.due_reports(subs, SUNDAY.replace(hour=23, minute=59)) == []
+
+
+def test_successful_sends_free_their_bodies(reports):
+    subs = _subscriptions("1")
+    report_service.build_reports_batch(subs, 10, SUNDAY.date())
+    due = report_service.due_reports(subs, SUNDAY)
+    report_service.mark_delivered([cid for cid, _ in due], [], SUNDAY)
+    state = json.loads(reports.read_text())
+    assert state["cursor"] == 1 and state["bodies"] == {}
+
+
+def test_new_session_invalidates_body_saved_on_disk(reports, monkeypatch):
+    subs = _subscriptions("1")
+    report_service.build_reports_batch(subs, 10, SUNDAY.date())
+    assert "1" in json.loads(reports.read_text())["bodies"]
+
+    # Tras un reinicio el estado aún no está cargado en memoria
+    monkeypatch.setattr(report_service, "_state", None)
+    report_service._on_session_logged(1, Session(SUNDAY.date(), "Cálculo"))
+
+    assert json.loads(reports.read_text())["bodies"] == {}
+
+
+def test_subscriber_added_while_sending_is_not_skipped(reports):
+    subs = _subscriptions("1", "2")
+    due = report_service.due_reports(subs, SUNDAY)
+    assert [cid for cid, _ in due] == ["1", "2"]
+
+    # Mientras se envía, el job de armado agrega un suscriptor con horario ya pasado
+    subs["3"] = {"report_time": "19:30"}
+    report_service.build_reports_batch(subs, 10, SUNDAY.date())
+    report_service.mark_delivered([cid for cid, _ in due], [], SUNDAY)
+
+    assert report_service.due_reports(subs, SUNDAY) == [("3", "reporte 3")]
+    report_service.mark_delivered(["3"], [], SUNDAY)
+    assert report_service.due_reports(subs, SUNDAY) == []
+
+
+def test_unconfirmed_reports_are_handed_out_again_after_restart(reports, monkeypatch):
+    subs = _subscriptions("1")
+    assert [cid for cid, _ in report_service.due_reports(subs, SUNDAY)] == ["1"]
+
+    monkeypatch.setattr(report_service, "_state", None)
+    assert [cid for cid, _ in report_service.due_reports(subs, SUNDAY)] == ["1"]
+
+
+def test_groups_get_no_weekly_report(reports, monkeypatch):
+    subs = {"-100123": {"report_time": "20:00"}, "1": {"report_time": "20:00"}}
+    assert [cid for cid, _ in report_service.due_reports(subs, SUNDAY)] == ["1"]
+
+    # Cola guardada por una versión anterior, con el grupo aún pendiente
+    report_service._state.update({"queue": [[1200, "-100123"], [1200, "1"]], "cursor": 0, "in_flight": []})
+    assert [cid for cid, _ in report_service.due_reports(subs, SUNDAY)] == ["1"]